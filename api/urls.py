@@ -0,0 +1,16 @@
+from django.urls import path
+from api import views
+
+app_name = 'api'
+urlpatterns = [
+    path('api/v1/articles/',
+         views.ArticleListView.as_view(), name='v1-articles'),
+    path('api/v1/articles/<int:pk>/',
+         views.ArticleDetailView.as_view(), name='v1-article'),
+    path('api/v1/authors/<int:pk>/',
+         views.AuthorView.as_view(), name='v1-author'),
+    path('api/v1/tags/',
+         views.TagListView.as_view(), name='v1-tags'),
+    path('api/v1/search/',
+         views.SearchView.as_view(), name='v1-search'),
+]
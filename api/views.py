@@ -0,0 +1,446 @@
+"""
+Read-only JSON API, version 1.
+
+Responses hold what they show in 'data', lists also the URL of their next
+page in 'next' (null on the last one). Lists are read by cursor, an
+opaque token found in 'next', rather than by page number, so that reading
+on costs the same on every page and skips nothing when articles are
+published meanwhile. Objects have the fields listed in ?fields=, or their
+default ones, and rows are read with values(), only with the columns
+these fields need.
+
+Every response carries an ETag made of the version counters of what it
+shows (see core.versions): a request with a matching If-None-Match is
+answered 304 without reading anything from the database. Reads of
+articles only bump the article read, the ETags of responses showing
+read counts of other articles change every READS_INTERVAL seconds. The API shows
+what the public pages show, to anyone, and nothing in it depends on who
+asks.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import time
+from bisect import bisect_left
+from django.db.models import Count, Q, Sum
+from django.http import Http404, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views import View
+from users.models import CustomUser
+from core.models import Article, ArticleTaggedItem, Reaction, SocialMedia, Subscription, Tag, \
+    UserDescription
+from core import search
+from core.postings import get_postings
+from core.rendering import render_text
+from core.tags import normalize_tag, tag_ids_by_key
+from core.versions import get_versions, instance
+
+
+API_VERSION = 'v1'
+
+READS_INTERVAL = 5 * 60
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ApiError('Invalid cursor')
+    if not isinstance(position, dict):
+        raise ApiError('Invalid cursor')
+    return position
+
+
+def media_url(model, field, name):
+    return model._meta.get_field(field).storage.url(name) if name else None
+
+
+def article_tags(article_ids):
+    """
+    Keys of the tags of the given articles, by article id
+    """
+    tags = {}
+    links = ArticleTaggedItem.objects.\
+        filter(content_object_id__in=article_ids).\
+        order_by('tag__key').\
+        values_list('content_object_id', 'tag__key')
+    for article_id, key in links:
+        tags.setdefault(article_id, []).append(key)
+    return tags
+
+
+def article_reactions(article_id):
+    return Reaction.objects.filter(article_id=article_id).aggregate(
+        likes=Count('id', filter=Q(value=1)),
+        dislikes=Count('id', filter=Q(value=-1)))
+
+
+class ApiView(View):
+    http_method_names = ['get', 'head', 'options']
+    # Fields objects can have, with the column each one is read from,
+    # None for those computed otherwise
+    fields = {}
+    default_fields = []
+    default_limit = 20
+    max_limit = 100
+
+    def get_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.default_fields)
+        fields = list(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+        return fields
+
+    def get_columns(self, fields, required=('id', )):
+        return list(dict.fromkeys([*required, *(self.fields[field] for field in fields
+                                                if self.fields[field])]))
+
+    def get_limit(self):
+        value = self.request.GET.get('limit')
+        if not value or not value.isdigit():
+            return self.default_limit
+        return max(1, min(int(value), self.max_limit))
+
+    def get_cursor(self):
+        cursor = self.request.GET.get('cursor')
+        return decode_cursor(cursor) if cursor else None
+
+    def get_next_url(self, position):
+        if position is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = encode_cursor(position)
+        return f'{self.request.path}?{query.urlencode()}'
+
+    def get_version_names(self, fields):
+        """
+        Version counters of everything the response shows
+        """
+        return []
+
+    def shows_reads(self, fields):
+        return False
+
+    def get_etag(self, fields):
+        versions = [str(version) for version in get_versions(*self.get_version_names(fields))]
+        if self.shows_reads(fields):
+            # read counts have no version of their own
+            versions.append(f'reads{int(time.time() // READS_INTERVAL)}')
+        versions = '.'.join(versions)
+        digest = hashlib.sha1(f'{self.request.get_full_path()}:{versions}'.encode()).hexdigest()
+        return quote_etag(f'{API_VERSION}-{digest}')
+
+    def get_data(self, fields):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        etag = self.get_etag(fields)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(self.get_data(fields))
+        response['ETag'] = etag
+        # kept by clients, but checked with the server every time
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': error.message}, status=error.status)
+        except Http404:
+            return JsonResponse({'error': 'Not found'}, status=404)
+
+
+class ArticlesMixin:
+    fields = {
+        'id': 'id',
+        'title': 'title',
+        'excerpt': 'excerpt',
+        'image': 'image',
+        'pub_date': 'pub_date',
+        'times_read': 'times_read',
+        'author': 'author_id',
+        'author_username': 'author__username',
+        'tags': None,
+        'url': None,
+    }
+    default_fields = list(fields)
+
+    def shows_reads(self, fields):
+        return 'times_read' in fields
+
+    def get_article_versions(self, fields):
+        names = []
+        if 'author_username' in fields:
+            names.append(('users', ))
+        if 'tags' in fields:
+            names.append(('tags', ))
+        return names
+
+    def serialize_articles(self, rows, fields):
+        tags = article_tags([row['id'] for row in rows]) if 'tags' in fields else {}
+        data = []
+        for row in rows:
+            item = {}
+            for field in fields:
+                if field == 'tags':
+                    item[field] = tags.get(row['id'], [])
+                elif field == 'url':
+                    item[field] = reverse('public:article-detail', args=(row['id'], ))
+                elif field == 'image':
+                    item[field] = media_url(Article, 'image', row['image'])
+                else:
+                    item[field] = row[self.fields[field]]
+            data.append(item)
+        return data
+
+    def get_articles(self, article_ids, fields):
+        # Articles with the given ids, in their order
+        rows = Article.objects.filter(id__in=article_ids).values(*self.get_columns(fields))
+        rows = {row['id']: row for row in rows}
+        return self.serialize_articles([rows[pk] for pk in article_ids if pk in rows], fields)
+
+
+class ArticleListView(ArticlesMixin, ApiView):
+    """
+    Articles, newest first, of an author (?author=<id>) or with a tag
+    (?tag=<key>) if asked
+    """
+
+    def get_tag_id(self):
+        key = normalize_tag(self.request.GET.get('tag', ''))
+        return tag_ids_by_key(Tag, [key]).get(key) if key else None
+
+    def get_author_id(self):
+        author = self.request.GET.get('author')
+        if author is None:
+            return None
+        if not author.isdigit():
+            raise ApiError('Invalid author')
+        return int(author)
+
+    def get_version_names(self, fields):
+        names = [('articles', ), *self.get_article_versions(fields)]
+        if 'tag' in self.request.GET and ('tags', ) not in names:
+            names.append(('tags', ))
+        return names
+
+    def get_page_ids(self, before, limit):
+        if 'tag' in self.request.GET:
+            tag_id = self.get_tag_id()
+            if tag_id is None:
+                return []
+            # ids of the articles with the tag, from their posting list
+            postings = get_postings([tag_id])[tag_id]
+            end = bisect_left(postings, before) if before is not None else len(postings)
+            return list(reversed(postings[max(0, end - limit):end]))
+        articles = Article.objects.order_by('-id')
+        author_id = self.get_author_id()
+        if author_id is not None:
+            articles = articles.filter(author_id=author_id)
+        if before is not None:
+            articles = articles.filter(id__lt=before)
+        return list(articles.values_list('id', flat=True)[:limit])
+
+    def get_data(self, fields):
+        cursor = self.get_cursor()
+        before = cursor.get('before') if cursor else None
+        if before is not None and not isinstance(before, int):
+            raise ApiError('Invalid cursor')
+        limit = self.get_limit()
+        # one more to know if there is a next page
+        page_ids = self.get_page_ids(before, limit + 1)
+        next_position = {'before': page_ids[limit - 1]} if len(page_ids) > limit else None
+        return {'data': self.get_articles(page_ids[:limit], fields),
+                'next': self.get_next_url(next_position)}
+
+
+class ArticleDetailView(ArticlesMixin, ApiView):
+    fields = {
+        **ArticlesMixin.fields,
+        'content': 'content',
+        'content_html': 'content_html',
+        'word_count': 'word_count',
+        'comment_count': 'comment_count',
+        'likes': None,
+        'dislikes': None,
+    }
+    default_fields = list(fields)
+
+    def get_version_names(self, fields):
+        pk = self.kwargs['pk']
+        names = [('article', pk), *self.get_article_versions(fields)]
+        if 'comment_count' in fields:
+            names.append(('article-comments', pk))
+        if 'likes' in fields or 'dislikes' in fields:
+            names.append(('article-reactions', pk))
+        return names
+
+    def get_data(self, fields):
+        pk = self.kwargs['pk']
+        row = Article.objects.filter(pk=pk).values(*self.get_columns(fields)).first()
+        if not row:
+            raise Http404
+        if 'content_html' in fields and not row['content_html']:
+            # not rendered yet, see the rendercontent command
+            content = row['content'] if 'content' in fields else \
+                Article.objects.filter(pk=pk).values_list('content', flat=True).first()
+            row['content_html'] = render_text(content)
+        if 'likes' in fields or 'dislikes' in fields:
+            row.update(article_reactions(pk))
+        return {'data': self.serialize_articles([row], fields)[0]}
+
+    def serialize_articles(self, rows, fields):
+        counted = ('likes', 'dislikes')
+        data = super().serialize_articles(rows, [field for field in fields if field not in counted])
+        return [{field: row[field] if field in counted else item[field] for field in fields}
+                for item, row in zip(data, rows)]
+
+
+class AuthorView(ApiView):
+    fields = {
+        'id': 'id',
+        'username': 'username',
+        'user_image': 'user_image',
+        'date_joined': 'date_joined',
+        'description': None,
+        'social_media': None,
+        'subscribers': None,
+        'articles': None,
+        'readings': None,
+        'url': None,
+    }
+    default_fields = list(fields)
+
+    def get_version_names(self, fields):
+        pk = self.kwargs['pk']
+        names = [instance(CustomUser, pk)]
+        if 'description' in fields or 'social_media' in fields:
+            names.append(('user-profile', pk))
+        if 'subscribers' in fields:
+            names.append(('subscribers', pk))
+        if 'articles' in fields or 'readings' in fields:
+            names.append(('author-articles', pk))
+        return names
+
+    def shows_reads(self, fields):
+        return 'readings' in fields
+
+    def get_data(self, fields):
+        pk = self.kwargs['pk']
+        row = CustomUser.objects.filter(pk=pk).values(*self.get_columns(fields)).first()
+        if not row:
+            raise Http404
+        if 'description' in fields:
+            row['description'] = UserDescription.objects.\
+                filter(user_id=pk).values_list('content', flat=True).first()
+        if 'social_media' in fields:
+            titles = dict(SocialMedia.SOCIAL_MEDIA_TITLES)
+            row['social_media'] = [
+                {'title': titles.get(title, title), 'link': link}
+                for title, link in SocialMedia.objects.filter(user_id=pk).
+                order_by('title').values_list('title', 'link')
+            ]
+        if 'subscribers' in fields:
+            row['subscribers'] = Subscription.objects.filter(subscribe_to_id=pk).count()
+        if 'articles' in fields or 'readings' in fields:
+            totals = Article.objects.filter(author_id=pk).\
+                aggregate(articles=Count('id'), readings=Sum('times_read'))
+            row['articles'] = totals['articles']
+            row['readings'] = totals['readings'] or 0
+        if 'user_image' in fields:
+            row['user_image'] = media_url(CustomUser, 'user_image', row['user_image'])
+        if 'url' in fields:
+            row['url'] = reverse('public:author-page', args=(pk, ))
+        return {'data': {field: row[field] for field in fields}}
+
+
+class TagListView(ApiView):
+    """
+    Tags having articles, by key
+    """
+    fields = {
+        'key': 'key',
+        'name': 'name',
+        'articles': 'articles',
+        'url': None,
+    }
+    default_fields = list(fields)
+
+    def get_version_names(self, fields):
+        return [('tags', )]
+
+    def get_data(self, fields):
+        cursor = self.get_cursor()
+        after = cursor.get('after') if cursor else None
+        if after is not None and not isinstance(after, str):
+            raise ApiError('Invalid cursor')
+        limit = self.get_limit()
+        tags = Tag.objects.order_by('key')
+        if after is not None:
+            tags = tags.filter(key__gt=after)
+        if 'articles' in fields:
+            tags = tags.annotate(articles=Count('tagged_articles')).filter(articles__gt=0)
+        else:
+            tags = tags.filter(id__in=ArticleTaggedItem.objects.values('tag_id'))
+        rows = list(tags.values(*self.get_columns(fields, required=('key', )))[:limit + 1])
+        next_position = {'after': rows[limit - 1]['key']} if len(rows) > limit else None
+        data = []
+        for row in rows[:limit]:
+            if 'url' in fields:
+                row['url'] = reverse('public:articles-tag', args=(row['key'], ))
+            data.append({field: row[field] for field in fields})
+        return {'data': data, 'next': self.get_next_url(next_position)}
+
+
+class SearchView(ArticlesMixin, ApiView):
+    """
+    Articles found for ?query=, as the search page finds them; 'match'
+    tells how (see core.search.find_articles)
+    """
+
+    def get_query(self):
+        query = self.request.GET.get('query', '').strip()
+        if not query.strip('#%'):
+            raise ApiError('Empty query')
+        return query
+
+    def get_version_names(self, fields):
+        return [('articles', ), ('users', ), ('tags', )]
+
+    def get_data(self, fields):
+        match, article_ids = search.find_articles(self.get_query())
+        cursor = self.get_cursor()
+        offset = cursor.get('offset', 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise ApiError('Invalid cursor')
+        limit = self.get_limit()
+        page_ids = list(article_ids[offset:offset + limit])
+        next_position = {'offset': offset + limit} if offset + limit < len(article_ids) else None
+        return {'match': match,
+                'count': len(article_ids),
+                'data': self.get_articles(page_ids, fields),
+                'next': self.get_next_url(next_position)}
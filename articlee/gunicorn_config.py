@@ -0,0 +1,69 @@
+"""
+Gunicorn configuration for articlee project.
+
+Used by the Procfile: gunicorn articlee.wsgi -c articlee/gunicorn_config.py
+
+Every value can be overridden through the environment, see
+https://docs.gunicorn.org/en/stable/settings.html
+"""
+
+import os
+
+
+def cpu_count():
+    # Containers often see every CPU of the host, while only
+    # some of them are available to the process
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Load the application once in the master process, so that workers
+# share its memory copy-on-write instead of importing everything again
+preload_app = True
+
+# Recycle workers after a number of requests to keep memory growth in
+# check, with jitter so that workers don't all restart at the same time
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # Runs in the master before any worker is forked: what it loads is
+    # shared by every worker, including the ones replacing recycled workers
+    if server.cfg.preload_app:
+        from articlee.warmup import warm_up_shared
+        warm_up_shared()
+
+
+def pre_fork(server, worker):
+    # Connections opened while preloading must not be shared between
+    # processes, the threads of each worker open their own
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from articlee.warmup import warm_up_worker
+        warm_up_worker()
+        return
+    # Importing the WSGI module sets Django up when the app isn't preloaded
+    import articlee.wsgi  # noqa: F401
+    from articlee.warmup import warm_up
+    warm_up()
@@ -50,8 +50,11 @@ INSTALLED_APPS = [
     'users',
     'personal',
     'public',
+    'api',
+    # Only the storage app is installed, the project uses none of the
+    # template tags or fields of the 'cloudinary' app; the SDK is imported
+    # by the media storage on first use, see core.storage
     'cloudinary_storage',
-    'cloudinary',
 ]
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
@@ -59,10 +62,11 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.IdentityMapMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -98,11 +102,56 @@ DATABASES = {
         'HOST': os.environ.get("DB_HOST"),
         'USER': os.environ.get("DB_USER"),
         'PASSWORD': os.environ.get("DB_PASSWORD"),
-        'PORT': os.environ.get("DB_PORT")
+        'PORT': os.environ.get("DB_PORT"),
+        # Keep connections open between requests: each thread of a worker
+        # reuses the one it opened for its first request
+        'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Every process serves hot entries from its own memory, in front of the
+# cache shared by all workers: redis when REDIS_URL is set, files otherwise
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED_ALIAS': 'shared',
+            'LOCAL_MAX_ENTRIES': 5000,
+            'LOCAL_TIMEOUT': 30,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get("CACHE_DIR", '/tmp/articlee-cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+if os.environ.get("REDIS_URL"):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get("REDIS_URL"),
+        'TIMEOUT': 300,
+    }
+
+
+# Sessions are read from the shared cache and written through to the
+# database. Not from the default cache: its process tier would go on
+# serving sessions that ended in other workers for up to LOCAL_TIMEOUT.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+SESSION_CACHE_ALIAS = 'shared'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -149,7 +198,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+DEFAULT_FILE_STORAGE = 'core.storage.MediaStorage'
 
 
 MESSAGE_TAGS = {
@@ -164,6 +213,16 @@ LOGIN_URL = reverse_lazy('core:become-user')
 
 TAGGIT_CASE_INSENSITIVE = True
 
+# Readings older than this are rolled up into ArticleDailyReads and
+# UserMonthlyReadings, archived and deleted by the compactreadings command
+READINGS_RETENTION_DAYS = int(os.environ.get("READINGS_RETENTION_DAYS", 180))
+
+READINGS_ARCHIVE_DIR = os.environ.get("READINGS_ARCHIVE_DIR", BASE_DIR / 'archive' / 'readings')
+
+# Codec article contents are written with: 'zlib', 'zstd' (needs the
+# zstandard package) or 'raw', see core.fields
+CONTENT_CODEC = os.environ.get("CONTENT_CODEC", "zlib")
+
 
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.environ.get("CLOUD_NAME"),
@@ -25,6 +25,7 @@ urlpatterns = [
     path('', include('users.urls')),
     path('', include('personal.urls')),
     path('', include('public.urls')),
+    path('', include('api.urls')),
 ]
 
 
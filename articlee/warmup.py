@@ -0,0 +1,108 @@
+"""
+Warm-up for freshly started server processes.
+
+Compiles the project's templates, builds the URL resolver's reverse
+lookup tables, loads the media storage backend and builds the search
+typeahead and trigram indexes, so that the first request served by a
+worker doesn't pay for any of it.
+
+Database connections aren't opened ahead: they belong to the thread
+opening them, and requests are served by the threads of the worker,
+not by the thread warming it up.
+
+When the app is preloaded, warm_up_shared() runs in the master process
+before it forks, so that workers share what it loads copy-on-write, and
+every worker only runs warm_up_worker(). Otherwise workers run both.
+"""
+
+import logging
+from pathlib import Path
+from django.conf import settings
+from django.core.files.storage import storages
+from django.db import connections, DatabaseError
+from django.template import engines, TemplateDoesNotExist, TemplateSyntaxError
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+
+
+logger = logging.getLogger(__name__)
+
+
+def project_template_dirs():
+    # Only directories inside the project: compiling every template of
+    # django.contrib.admin would cost more memory than it saves time
+    base_dir = Path(settings.BASE_DIR).resolve()
+    dirs = [Path(d) for engine in settings.TEMPLATES for d in engine['DIRS']]
+    dirs += [Path(d) for d in get_app_template_dirs('templates')]
+    return [d for d in dirs if d.resolve().is_relative_to(base_dir)]
+
+
+def compile_templates():
+    compiled = 0
+    for engine in engines.all():
+        for template_dir in project_template_dirs():
+            for path in template_dir.rglob('*.html'):
+                name = path.relative_to(template_dir).as_posix()
+                try:
+                    engine.get_template(name)
+                except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                    logger.warning('Could not compile template %s: %s', name, exc)
+                else:
+                    compiled += 1
+    return compiled
+
+
+def prime_url_resolver():
+    resolver = get_resolver()
+    # Accessing reverse_dict populates the lookups of the root resolver
+    # and of every included namespace
+    primed = len(resolver.reverse_dict)
+    for prefix, namespace_resolver in resolver.namespace_dict.values():
+        primed += len(namespace_resolver.reverse_dict)
+    return primed
+
+
+def load_storage():
+    # The media storage imports the cloudinary SDK on first use
+    storage = storages['default']
+    getattr(storage, 'backend', None)
+
+
+def build_typeahead_index():
+    from core import typeahead
+    try:
+        return typeahead.build()
+    except DatabaseError as exc:
+        # built on first use instead
+        logger.warning('Could not build typeahead index: %s', exc)
+        return 0
+
+
+def build_trigram_index():
+    from core import trigrams
+    try:
+        return trigrams.build()
+    except DatabaseError as exc:
+        logger.warning('Could not build trigram index: %s', exc)
+        return 0
+
+
+def warm_up_shared():
+    templates = compile_templates()
+    patterns = prime_url_resolver()
+    load_storage()
+    logger.info('Warm-up compiled %d templates and %d URL patterns', templates, patterns)
+
+
+def warm_up_worker():
+    suggestions = build_typeahead_index()
+    fuzzy = build_trigram_index()
+    # no request would ever use the connection the indexes were read with
+    connections.close_all()
+    logger.info('Warm-up indexed %d suggestions and %d names for fuzzy search',
+                suggestions, fuzzy)
+
+
+def warm_up():
+    warm_up_shared()
+    warm_up_worker()
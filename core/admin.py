@@ -4,8 +4,13 @@ from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
 from django.utils.html import format_html
 from django.db.models.query_utils import Q
+from taggit.models import Tag as TaggitTag
 from users.models import CustomUser
-from core.models import Article, Comment, Reaction
+from core.models import Article, Comment, Reaction, Tag
+
+
+# Articles are tagged with core's Tag, taggit's own table is no longer used
+admin.site.unregister(TaggitTag)
 
 
 @admin.register(Article)
@@ -58,3 +63,10 @@ class CommentAdmin(admin.ModelAdmin):
     def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
         return super().get_queryset(request).\
             select_related('user', 'article')
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key']
+    search_fields = ['name', 'key']
+    readonly_fields = ['key']
@@ -0,0 +1,55 @@
+"""
+Users of requests, read from the cache.
+
+Django loads the user of every authenticated request from the database
+and checks the password hash kept in their session against theirs.
+get_user() caches the user once checked, under a key made of their id,
+a fingerprint of the session's hash and backend, and the version of the
+user (see core.versions). A session is served the cached user only if
+it holds the same hash as the one that was checked, and any save of the
+user bumps their version: a user changing their details or password
+(see users.views.ChangeUserView), edited or deactivated in the admin,
+is loaded and checked again on their next request. Inactive users are
+never cached, the backend doesn't return them.
+"""
+
+import hashlib
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import cache
+from users.models import CustomUser
+from core.versions import instance, make_key
+
+
+USER_TIMEOUT = 5 * 60
+
+
+def user_key(request):
+    """
+    Cache key of the user of the request's session, None without one
+    """
+    session = request.session
+    try:
+        pk = CustomUser._meta.pk.to_python(session[SESSION_KEY])
+        backend_path = session[BACKEND_SESSION_KEY]
+        session_hash = session[HASH_SESSION_KEY]
+    except (KeyError, ValueError):
+        return None
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    fingerprint = hashlib.sha256(f'{backend_path}:{session_hash}'.encode()).hexdigest()
+    return make_key('session-user', instance(CustomUser, pk), parts=(pk, fingerprint))
+
+
+def get_user(request):
+    key = user_key(request)
+    if key is None:
+        return auth.get_user(request)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            # checking the session may have moved it to a new hash
+            cache.set(user_key(request), user, USER_TIMEOUT)
+    return user
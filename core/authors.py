@@ -0,0 +1,83 @@
+"""
+Author cards: what pages show of an author, cached as one value.
+
+The article, author, about and articles-by-author pages all show an
+author with some of their profile and statistics. get_author_card()
+builds all of it at once and caches it under the versions of the user,
+their profile (description and social media), their subscribers and
+their articles (see core.versions), so it is rebuilt only when one of
+them changes, or when it expires for its number of reads, and every
+page of the author is served it from the cache.
+
+A card is built in one query, and a second one for the social media
+links of authors who have any.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from users.models import CustomUser
+from core.models import Article, SocialMedia, Subscription
+from core.versions import instance, make_key
+
+
+# Reads don't bump the author's articles, read totals lag up to this
+AUTHOR_CARD_TIMEOUT = 5 * 60
+
+
+class AuthorCard:
+
+    def __init__(self, author, description, social_media, subscribers, articles, readings):
+        self.author = author
+        self.description = description
+        self.social_media = social_media
+        self.subscribers = subscribers
+        self.articles = articles
+        self.readings = readings
+
+
+def _total(queryset, column, aggregate):
+    # aggregate of the author's rows, 0 when they have none
+    totals = queryset.filter(**{column: OuterRef('pk')}).\
+        order_by().\
+        values(column).\
+        annotate(total=aggregate).\
+        values('total')
+    return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+
+
+def build_author_card(pk):
+    author = CustomUser.objects.\
+        filter(pk=pk).\
+        select_related('userdescription').\
+        annotate(card_subscribers=_total(Subscription.objects, 'subscribe_to', Count('id')),
+                 card_articles=_total(Article.objects, 'author', Count('id')),
+                 card_readings=_total(Article.objects, 'author', Sum('times_read')),
+                 card_social_media=_total(SocialMedia.objects, 'user', Count('id'))).\
+        first()
+    if author is None:
+        return None
+    description = getattr(author, 'userdescription', None)
+    social_media = []
+    if author.card_social_media:
+        social_media = list(SocialMedia.objects.filter(user=author).order_by('title'))
+    return AuthorCard(author=author,
+                      description=description.content if description else None,
+                      social_media=social_media,
+                      subscribers=author.card_subscribers,
+                      articles=author.card_articles,
+                      readings=author.card_readings)
+
+
+def get_author_card(pk):
+    """
+    The card of the author with the given id, or None
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    key = make_key('author-card', instance(CustomUser, pk), ('user-profile', pk),
+                   ('subscribers', pk), ('author-articles', pk))
+    # None is cached for missing authors too, creating one bumps its version
+    return cache.get_or_recompute(key, lambda: build_author_card(pk), AUTHOR_CARD_TIMEOUT)
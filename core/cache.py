@@ -0,0 +1,359 @@
+"""
+Two-tier cache backend.
+
+Every process keeps a small LRU of recently used entries in front of the
+cache shared by all workers (``SHARED_ALIAS``, a file based cache or redis,
+see CACHES in settings). Reads are served from the process when possible,
+writes go to both tiers. Entries in the process tier live at most
+``LOCAL_TIMEOUT`` seconds, which bounds how long another process' write
+can go unnoticed; keys that change often should be versioned instead of
+overwritten.
+
+``get_or_recompute`` protects expensive values from thundering herds:
+the value is recomputed a little before it expires, with a probability
+that grows as expiry comes closer, and only by the one process holding
+the recompute lock of its key, while everyone else keeps being served
+the previous value.
+
+Keys are grouped in namespaces by the part of the key before the first
+colon, ``stats()`` reports hits, misses and evictions of each namespace.
+"""
+
+import math
+import pickle
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+def namespace_of(key):
+    return str(key).split(':', 1)[0]
+
+
+class LocalLRU:
+    """
+    Size bounded, thread safe mapping of keys to pickled values with expiry
+    """
+
+    def __init__(self, max_entries, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return pickled
+
+    def set(self, key, pickled, expires_at):
+        evicted = []
+        with self._lock:
+            self._data[key] = (expires_at, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self.on_evict:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Envelope:
+    """
+    Value stored by get_or_recompute: along with the value it keeps how long
+    computing it took and when it expires, to decide on early recomputation
+    """
+
+    def __init__(self, value, delta, expires_at):
+        self.value = value
+        self.delta = delta
+        self.expires_at = expires_at
+
+    def should_recompute(self, beta):
+        if self.expires_at is None:
+            return False
+        # Probabilistic early expiration: -log(random()) is exponentially
+        # distributed, so most requests see the value as fresh until the
+        # last few multiples of delta before expiry
+        jitter = self.delta * beta * -math.log(1.0 - random.random())
+        return time.time() + jitter >= self.expires_at
+
+
+class ProcessTier:
+    """
+    State of a two-tier cache shared by every thread of the process
+    """
+
+    def __init__(self, max_entries):
+        self.stats = defaultdict(Counter)
+        self.lru = LocalLRU(max_entries, on_evict=self.count_eviction)
+        # Striped, so that the number of locks doesn't grow with the keys
+        self.recompute_locks = [threading.Lock() for _ in range(64)]
+
+    def count_eviction(self, local_key):
+        self.stats[local_key[1]]['evictions'] += 1
+
+
+# Django creates cache backends per thread, the process tiers are
+# kept here so that all threads of a worker share them, by LOCATION
+_process_tiers = {}
+_process_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 30)
+        with _process_tiers_lock:
+            tier = _process_tiers.get(location)
+            if tier is None:
+                tier = _process_tiers[location] = ProcessTier(
+                    options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._stats = tier.stats
+        self._local = tier.lru
+        self._recompute_locks = tier.recompute_locks
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_key(self, key, version):
+        return (self.make_and_validate_key(key, version=version), namespace_of(key))
+
+    def _local_expiry(self, timeout):
+        expires_at = self.get_backend_timeout(timeout)
+        local_expires_at = time.time() + self.local_timeout
+        if expires_at is None:
+            return local_expires_at
+        return min(expires_at, local_expires_at)
+
+    def _set_local(self, key, value, timeout, version):
+        self._local.set(self._local_key(key, version),
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        self._local_expiry(timeout))
+
+    def get(self, key, default=None, version=None):
+        return self._get(key, default, version)
+
+    def _get(self, key, default=None, version=None, count=True):
+        local_key = self._local_key(key, version)
+        # lookups repeated within one operation are counted once
+        stats = self._stats[local_key[1]] if count else Counter()
+        pickled = self._local.get(local_key)
+        if pickled is not None:
+            stats['local_hits'] += 1
+            return pickle.loads(pickled)
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            stats['misses'] += 1
+            return default
+        stats['shared_hits'] += 1
+        # The remaining lifetime in the shared tier is unknown here,
+        # so the process tier keeps it for its own maximum only
+        self._set_local(key, value, self.local_timeout, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            local_key = self._local_key(key, version)
+            pickled = self._local.get(local_key)
+            if pickled is None:
+                missing.append(key)
+            else:
+                self._stats[local_key[1]]['local_hits'] += 1
+                found[key] = pickle.loads(pickled)
+        if missing:
+            from_shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                stats = self._stats[namespace_of(key)]
+                if key in from_shared:
+                    stats['shared_hits'] += 1
+                    self._set_local(key, from_shared[key], self.local_timeout, version)
+                else:
+                    stats['misses'] += 1
+            found.update(from_shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self.shared.set(key, value, timeout, version=version)
+        self._set_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._set_local(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.delete(self._local_key(key, version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters live in the shared tier only, a process copy would
+        # hide increments made by other workers
+        self._local.delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local.get(self._local_key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self._local.delete(self._local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local.delete(self._local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        self._local.clear()
+
+    def _recompute_lock(self, key):
+        return self._recompute_locks[hash(key) % len(self._recompute_locks)]
+
+    def get_or_recompute(self, key, compute, timeout=DEFAULT_TIMEOUT, beta=1.0, version=None):
+        """
+        Returns the value cached under key, calling compute() to produce it
+        when it is missing or about to expire. Only one thread of one
+        process recomputes a key at a time, the others are served the
+        previous value while there is one.
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        stats = self._stats[namespace_of(key)]
+        envelope = self.get(key, version=version)
+        if isinstance(envelope, Envelope) and not envelope.should_recompute(beta):
+            return envelope.value
+
+        def recomputed(current):
+            return isinstance(current, Envelope) and (
+                not isinstance(envelope, Envelope) or current.expires_at != envelope.expires_at)
+
+        lock_key = f'lock:{key}'
+        # The process lock only covers checking the value and taking the
+        # shared lock: other keys of its stripe aren't held up while this
+        # one is computed or waited for
+        with self._recompute_lock(key):
+            # Another thread may have recomputed it meanwhile
+            current = self._get(key, version=version, count=False)
+            if recomputed(current):
+                return current.value
+            token = self._take_lock(lock_key, version)
+            if token is not None:
+                # or finished, releasing the lock, right after the check
+                latest = self._get(key, version=version, count=False)
+                if recomputed(latest):
+                    self._release_lock(lock_key, token, version)
+                    return latest.value
+        if token is None:
+            if isinstance(current, Envelope):
+                stats['stale_served'] += 1
+                return current.value
+            # Nothing to serve: wait for the process holding
+            # the lock rather than recomputing in parallel
+            current = self._wait_for_recompute(key, lock_key, version)
+            if current is not None:
+                return current.value
+            # The holder gave up: compute, with the lock if it is free now
+            token = self._take_lock(lock_key, version)
+        try:
+            started = time.monotonic()
+            value = compute()
+            delta = time.monotonic() - started
+            expires_at = self.get_backend_timeout(timeout)
+            stats['early_recomputes' if isinstance(current, Envelope) else 'recomputes'] += 1
+            self.set(key, Envelope(value, delta, expires_at), timeout, version=version)
+            return value
+        finally:
+            if token is not None:
+                self._release_lock(lock_key, token, version)
+
+    def _take_lock(self, lock_key, version):
+        """
+        Takes the shared recompute lock, returning the token that
+        releases it, or None when it is held already
+        """
+        token = uuid.uuid4().hex
+        if self.shared.add(lock_key, token, self.lock_timeout, version=version):
+            return token
+        return None
+
+    def _release_lock(self, lock_key, token, version):
+        # A lock that expired while computing may have been taken since
+        if self.shared.get(lock_key, version=version) == token:
+            self.shared.delete(lock_key, version=version)
+
+    def _wait_for_recompute(self, key, lock_key, version):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._local.delete(self._local_key(key, version))
+            current = self._get(key, version=version, count=False)
+            if isinstance(current, Envelope):
+                return current
+            if not self.shared.has_key(lock_key, version=version):
+                break
+        return None
+
+    def stats(self):
+        """
+        Hits, misses and evictions of the process tier, by key namespace
+        """
+        report = {}
+        for namespace, counter in sorted(self._stats.items()):
+            hits = counter['local_hits'] + counter['shared_hits']
+            lookups = hits + counter['misses']
+            report[namespace] = {
+                **counter,
+                'hit_rate': round(hits / lookups, 4) if lookups else None,
+            }
+        return report
@@ -0,0 +1,73 @@
+"""
+Text stored compressed.
+
+CompressedTextField is a TextField to models and forms: its value is a
+str. In the database it is a binary column holding one byte naming the
+codec followed by the encoded text, so that rows written with another
+codec, or before compression was turned on for small values, are still
+read. Texts shorter than MIN_COMPRESSED_SIZE bytes are stored as they
+are, compressing them would save next to nothing.
+
+zlib is always available; zstd needs the zstandard package, imported
+the first time it is used. The codec new values are written with is the
+CONTENT_CODEC setting.
+"""
+
+import zlib
+from django.conf import settings
+from django.db import models
+
+
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+
+CODECS = {'raw': RAW, 'zlib': ZLIB, 'zstd': ZSTD}
+
+MIN_COMPRESSED_SIZE = 256
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compress(text, codec=None):
+    data = text.encode()
+    codec = CODECS[codec or getattr(settings, 'CONTENT_CODEC', 'zlib')]
+    if codec == RAW or len(data) < MIN_COMPRESSED_SIZE:
+        return bytes([RAW]) + data
+    if codec == ZSTD:
+        import zstandard
+        return bytes([ZSTD]) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return bytes([ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(value):
+    value = bytes(value)
+    codec, data = value[0], value[1:]
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    elif codec == ZSTD:
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec != RAW:
+        raise ValueError(f'Unknown codec {codec} of compressed text')
+    return data.decode()
+
+
+class CompressedTextField(models.TextField):
+    description = 'Text stored compressed'
+
+    def get_internal_type(self):
+        # the column type, values are bytes in the database
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return value
+        return connection.Database.Binary(compress(value))
@@ -0,0 +1,109 @@
+import gzip
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from core.models import UserReading, ArticleDailyReads, UserMonthlyReadings
+
+
+class Command(BaseCommand):
+    help = 'Rolls readings older than the retention horizon up into daily and monthly ' \
+           'aggregates, archives them to compressed NDJSON and deletes them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.READINGS_RETENTION_DAYS,
+                            help='Retention horizon, readings older than this many days are compacted')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--archive-dir', default=settings.READINGS_ARCHIVE_DIR)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the readings that would be compacted')
+
+    def roll_up(self, readings):
+        daily = defaultdict(int)
+        monthly = {}
+        for reading in readings:
+            # days and months are those of the site's time zone, like on pages
+            date_read = timezone.localtime(reading.date_read)
+            daily[(reading.article_id, date_read.date())] += 1
+            key = (reading.user_id, reading.article_id, date_read.date().replace(day=1))
+            reads, last_read = monthly.get(key, (0, reading.date_read))
+            monthly[key] = (reads + 1, max(last_read, reading.date_read))
+
+        existing = ArticleDailyReads.objects.filter(
+            article_id__in={article_id for article_id, day in daily},
+            day__in={day for article_id, day in daily})
+        existing = {(row.article_id, row.day): row for row in existing}
+        to_update, to_create = [], []
+        for (article_id, day), reads in daily.items():
+            row = existing.get((article_id, day))
+            if row:
+                row.reads += reads
+                to_update.append(row)
+            else:
+                to_create.append(ArticleDailyReads(article_id=article_id, day=day, reads=reads))
+        ArticleDailyReads.objects.bulk_update(to_update, ['reads'])
+        ArticleDailyReads.objects.bulk_create(to_create)
+
+        existing = UserMonthlyReadings.objects.filter(
+            user_id__in={user_id for user_id, article_id, month in monthly},
+            article_id__in={article_id for user_id, article_id, month in monthly},
+            month__in={month for user_id, article_id, month in monthly})
+        existing = {(row.user_id, row.article_id, row.month): row for row in existing}
+        to_update, to_create = [], []
+        for (user_id, article_id, month), (reads, last_read) in monthly.items():
+            row = existing.get((user_id, article_id, month))
+            if row:
+                row.reads += reads
+                row.last_read = max(row.last_read, last_read)
+                to_update.append(row)
+            else:
+                to_create.append(UserMonthlyReadings(
+                    user_id=user_id, article_id=article_id, month=month,
+                    reads=reads, last_read=last_read))
+        UserMonthlyReadings.objects.bulk_update(to_update, ['reads', 'last_read'])
+        UserMonthlyReadings.objects.bulk_create(to_create)
+
+    def archive(self, archive, readings):
+        encoder = DjangoJSONEncoder()
+        for reading in readings:
+            archive.write(encoder.encode({
+                'id': reading.id,
+                'user_id': reading.user_id,
+                'article_id': reading.article_id,
+                'date_read': reading.date_read,
+            }) + '\n')
+        # Archived rows must be on disk before they are deleted
+        archive.flush()
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_readings = UserReading.objects.filter(date_read__lt=cutoff).order_by('id')
+        if options['dry_run']:
+            self.stdout.write(f'{old_readings.count()} readings older than {cutoff:%Y-%m-%d} to compact')
+            return
+
+        archive_dir = Path(options['archive_dir'])
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        archive_path = archive_dir / f'readings-{timezone.now():%Y%m%d%H%M%S}.ndjson.gz'
+        compacted = 0
+        with gzip.open(archive_path, 'at', encoding='utf-8') as archive:
+            while True:
+                readings = list(old_readings.only(
+                    'id', 'user_id', 'article_id', 'date_read')[:options['batch_size']])
+                if not readings:
+                    break
+                self.archive(archive, readings)
+                with transaction.atomic():
+                    self.roll_up(readings)
+                    UserReading.objects.filter(
+                        id__in=[reading.id for reading in readings]).delete()
+                compacted += len(readings)
+                self.stdout.write(f'Compacted {compacted} readings')
+        if not compacted:
+            archive_path.unlink()
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {compacted} readings older than {cutoff:%Y-%m-%d}'))
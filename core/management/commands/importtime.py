@@ -0,0 +1,87 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What each target runs in a fresh interpreter
+TARGETS = {
+    'wsgi': ['-c', 'import articlee.wsgi'],
+    'check': ['manage.py', 'check'],
+}
+
+IMPORT_TIME_LINE = re.compile(
+    r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent>\s*)(?P<module>\S+)$')
+
+
+class ImportRecord:
+
+    def __init__(self, module, self_us, cumulative_us, depth):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+
+def parse_import_times(output):
+    records = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        records.append(ImportRecord(
+            module=match['module'],
+            self_us=int(match['self']),
+            cumulative_us=int(match['cumulative']),
+            # python indents nested imports by two spaces per level
+            depth=(len(match['indent']) - 1) // 2,
+        ))
+    return records
+
+
+class Command(BaseCommand):
+    help = 'Reports the slowest module imports of starting the web app and of manage.py check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*',
+                            help=f'What to measure out of {", ".join(TARGETS)}, all by default')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of modules to report per target')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative',
+                            help='Sort by time spent in the module itself or including its imports')
+        parser.add_argument('--top-level', action='store_true',
+                            help='Only report modules imported directly by the target')
+
+    def measure(self, target):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'articlee.settings')
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', *TARGETS[target]],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise CommandError(f'{target} failed:\n{result.stderr[-2000:]}')
+        return parse_import_times(result.stderr), elapsed
+
+    def handle(self, *args, **options):
+        unknown = set(options['targets']) - set(TARGETS)
+        if unknown:
+            raise CommandError(f'Unknown targets: {", ".join(sorted(unknown))}')
+        for target in options['targets'] or TARGETS:
+            records, elapsed = self.measure(target)
+            total_ms = sum(r.self_us for r in records) / 1000
+            if options['top_level']:
+                records = [r for r in records if r.depth == 0]
+            key = 'self_us' if options['sort'] == 'self' else 'cumulative_us'
+            records.sort(key=lambda r: getattr(r, key), reverse=True)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{target}: {elapsed * 1000:.0f} ms wall time, '
+                f'{total_ms:.0f} ms in imports'))
+            for record in records[:options['limit']]:
+                self.stdout.write(
+                    f'{record.cumulative_us / 1000:9.1f} ms {record.self_us / 1000:9.1f} ms  '
+                    f'{"  " * record.depth}{record.module}')
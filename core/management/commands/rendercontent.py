@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Article
+from core.rendering import content_hash, render_content
+from core.versions import bump, instance
+
+
+class Command(BaseCommand):
+    help = 'Renders the content of articles saved before it was rendered, or with an ' \
+           'older renderer, to HTML in parallel processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes rendering content, 1 renders in this one')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true',
+                            help='Render every article, even those rendered already')
+
+    def stale(self, articles, force):
+        return [article for article in articles
+                if force or article.content_hash != content_hash(article.content)]
+
+    def render(self, articles, executor):
+        contents = [article.content for article in articles]
+        if executor is None:
+            rendered = map(render_content, contents)
+        else:
+            # workers only render, the database is used from this process
+            rendered = executor.map(render_content, contents, chunksize=16)
+        for article, html in zip(articles, rendered):
+            article.content_html = html
+            article.content_hash = content_hash(article.content)
+
+    def save(self, articles):
+        # the content of an article saved meanwhile was rendered by its save
+        with transaction.atomic():
+            current = dict(Article.objects.
+                           filter(id__in=[article.id for article in articles]).
+                           select_for_update().
+                           values_list('id', 'content_hash'))
+            articles = [article for article in articles
+                        if current.get(article.id) == article.loaded_hash]
+            Article.objects.bulk_update(articles, ['content_html', 'content_hash'])
+            # bulk_update() doesn't send post_save
+            bump(*(instance(article) for article in articles))
+        return len(articles)
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        last_id = 0
+        rendered = 0
+        try:
+            while True:
+                articles = list(Article.objects.
+                                filter(id__gt=last_id).
+                                order_by('id').
+                                only('id', 'content', 'content_hash')[:options['batch_size']])
+                if not articles:
+                    break
+                last_id = articles[-1].id
+                articles = self.stale(articles, options['force'])
+                for article in articles:
+                    article.loaded_hash = article.content_hash
+                self.render(articles, executor)
+                rendered += self.save(articles)
+                self.stdout.write(f'Rendered {rendered} articles, up to id {last_id}')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} articles'))
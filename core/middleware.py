@@ -0,0 +1,35 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+from core import auth, repository
+
+
+class IdentityMapMiddleware:
+    """
+    Gives every request its own identity map of articles (see core.repository)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        repository.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            repository.end_request()
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = auth.get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware reading users from the cache (see core.auth)
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
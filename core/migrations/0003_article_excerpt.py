@@ -0,0 +1,41 @@
+# Generated by Django 4.2.4 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+# A copy of core.models.make_excerpt as it was when this migration was
+# written, so that changing it doesn't change what this migration does
+def make_excerpt(content, length=200):
+    # First words of the content, cut on a word boundary
+    content = ' '.join(content.split())
+    if len(content) <= length:
+        return content
+    return content[:length - 1].rsplit(' ', 1)[0] + '\u2026'
+
+
+def fill_excerpts(apps, schema_editor):
+    Article = apps.get_model('core', 'Article')
+    batch = []
+    for article in Article.objects.only('id', 'content').iterator(chunk_size=500):
+        article.excerpt = make_excerpt(article.content)
+        batch.append(article)
+        if len(batch) == 500:
+            Article.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    Article.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_article_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userreading',
+            index=models.Index(fields=['user', 'date_read', 'id'], name='core_reading_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-19 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0004_userreading_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleDailyReads',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reads', models.PositiveIntegerField(default=0)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.article')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserMonthlyReadings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('reads', models.PositiveIntegerField(default=0)),
+                ('last_read', models.DateTimeField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.article')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'last_read', 'id'], name='core_monthly_user_last_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usermonthlyreadings',
+            constraint=models.UniqueConstraint(fields=('user', 'article', 'month'), name='core_monthly_readings_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='articledailyreads',
+            constraint=models.UniqueConstraint(fields=('article', 'day'), name='core_daily_reads_article_day_uniq'),
+        ),
+    ]
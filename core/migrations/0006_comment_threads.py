@@ -0,0 +1,59 @@
+# Generated by Django 4.2.4 on 2026-10-19 01:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
+import django.db.models.deletion
+
+
+# Path format of core.models at the time, the paths written here must
+# keep matching the ones of comments saved by this version
+PATH_SEGMENT_LENGTH = 10
+PATH_SEPARATOR = '/'
+
+
+def fill_paths_and_counts(apps, schema_editor):
+    Article = apps.get_model('core', 'Article')
+    Comment = apps.get_model('core', 'Comment')
+    # Every existing comment is a top-level one
+    Comment.objects.update(path=Concat(
+        LPad(Cast('id', models.CharField()), PATH_SEGMENT_LENGTH, Value('0')),
+        Value(PATH_SEPARATOR)))
+    comment_counts = Comment.objects.filter(article=OuterRef('pk')).\
+        order_by().values('article').annotate(count=Count('id')).values('count')
+    Article.objects.update(comment_count=Coalesce(Subquery(comment_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_reading_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='core.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', 'path'], name='core_comment_thread_idx'),
+        ),
+        migrations.RunPython(fill_paths_and_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.4 on 2026-10-19 02:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import taggit.managers
+
+
+def article_content_type(apps):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    return ContentType.objects.filter(app_label='core', model='article').first()
+
+
+def copy_tagged_items(apps, schema_editor):
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    ArticleTaggedItem = apps.get_model('core', 'ArticleTaggedItem')
+    content_type = article_content_type(apps)
+    if content_type is None:
+        return
+    generic_items = TaggedItem.objects.filter(content_type=content_type)
+    batch = []
+    for item in generic_items.iterator(chunk_size=1000):
+        batch.append(ArticleTaggedItem(tag_id=item.tag_id, content_object_id=item.object_id))
+        if len(batch) == 1000:
+            ArticleTaggedItem.objects.bulk_create(batch)
+            batch = []
+    ArticleTaggedItem.objects.bulk_create(batch)
+    generic_items.delete()
+
+
+def copy_tagged_items_back(apps, schema_editor):
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    ArticleTaggedItem = apps.get_model('core', 'ArticleTaggedItem')
+    content_type = article_content_type(apps)
+    if content_type is None:
+        return
+    TaggedItem.objects.bulk_create([
+        TaggedItem(tag_id=item.tag_id, content_type=content_type, object_id=item.content_object_id)
+        for item in ArticleTaggedItem.objects.iterator(chunk_size=1000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0005_auto_20220424_2025'),
+        ('core', '0006_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleTaggedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.article')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_items', to='taggit.tag')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='tags',
+            field=taggit.managers.TaggableManager(help_text='Use comma to separate tags, # is not needed to add tag', through='core.ArticleTaggedItem', to='taggit.Tag', verbose_name='Tags'),
+        ),
+        migrations.AddIndex(
+            model_name='articletaggeditem',
+            index=models.Index(fields=['tag', 'content_object'], name='core_tagged_tag_article_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='articletaggeditem',
+            constraint=models.UniqueConstraint(fields=('content_object', 'tag'), name='core_tagged_article_tag_uniq'),
+        ),
+        migrations.RunPython(copy_tagged_items, copy_tagged_items_back),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.4 on 2026-10-19 02:02
+
+import re
+from django.core.management.color import no_style
+from django.db import migrations, models
+import django.db.models.deletion
+import taggit.managers
+
+
+SEPARATORS = re.compile(r'[\s/-]+')
+
+
+def normalize_tag(name):
+    # Frozen copy of core.tags.normalize_tag: keys of the copied tags are
+    # the ones it gave then, whatever normalization becomes later
+    return SEPARATORS.sub('-', name.lower()).strip('-')
+
+
+def copy_tags(apps, schema_editor):
+    """
+    Copies taggit's tags, keeping their ids. Tags whose names have the same
+    key are merged into the oldest of them, tags without a key are dropped.
+    """
+    OldTag = apps.get_model('taggit', 'Tag')
+    Tag = apps.get_model('core', 'Tag')
+    ArticleTaggedItem = apps.get_model('core', 'ArticleTaggedItem')
+    kept = {}
+    merged = {}
+    dropped = []
+    for old_tag in OldTag.objects.order_by('id').iterator(chunk_size=1000):
+        key = normalize_tag(old_tag.name)
+        if not key:
+            dropped.append(old_tag.id)
+        elif key in kept:
+            merged[old_tag.id] = kept[key].id
+        else:
+            kept[key] = Tag(id=old_tag.id, name=old_tag.name, slug=old_tag.slug, key=key)
+    Tag.objects.bulk_create(kept.values(), batch_size=1000)
+
+    ArticleTaggedItem.objects.filter(tag_id__in=dropped).delete()
+    for old_id, new_id in merged.items():
+        links = ArticleTaggedItem.objects.filter(tag_id=old_id)
+        # articles that had both tags keep one link
+        links.filter(content_object__in=ArticleTaggedItem.objects.
+                     filter(tag_id=new_id).values('content_object')).delete()
+        links.update(tag_id=new_id)
+
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Tag]):
+            cursor.execute(sql)
+
+
+def copy_tags_back(apps, schema_editor):
+    OldTag = apps.get_model('taggit', 'Tag')
+    Tag = apps.get_model('core', 'Tag')
+    OldTag.objects.bulk_create([
+        OldTag(id=tag.id, name=tag.name, slug=tag.slug)
+        for tag in Tag.objects.iterator(chunk_size=1000)
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_article_tagged_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='name')),
+                ('slug', models.SlugField(allow_unicode=True, max_length=100, unique=True, verbose_name='slug')),
+                ('key', models.CharField(editable=False, max_length=100, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(copy_tags, copy_tags_back),
+        migrations.AlterField(
+            model_name='article',
+            name='tags',
+            field=taggit.managers.TaggableManager(help_text='Use comma to separate tags, # is not needed to add tag', through='core.ArticleTaggedItem', to='core.Tag', verbose_name='Tags'),
+        ),
+        migrations.AlterField(
+            model_name='articletaggeditem',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tagged_articles', to='core.tag'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.4 on 2026-10-19 02:40
+
+from django.db import migrations, models
+import core.fields
+
+
+BATCH_SIZE = 500
+
+
+def compress_contents(apps, schema_editor):
+    Article = apps.get_model('core', 'Article')
+    batch = []
+    for article in Article.objects.only('id', 'content').iterator(chunk_size=BATCH_SIZE):
+        article.content_compressed = article.content
+        article.word_count = len(article.content.split())
+        batch.append(article)
+        if len(batch) == BATCH_SIZE:
+            Article.objects.bulk_update(batch, ['content_compressed', 'word_count'])
+            batch = []
+    Article.objects.bulk_update(batch, ['content_compressed', 'word_count'])
+
+
+def decompress_contents(apps, schema_editor):
+    Article = apps.get_model('core', 'Article')
+    batch = []
+    for article in Article.objects.only('id', 'content_compressed').iterator(chunk_size=BATCH_SIZE):
+        article.content = article.content_compressed
+        batch.append(article)
+        if len(batch) == BATCH_SIZE:
+            Article.objects.bulk_update(batch, ['content'])
+            batch = []
+    Article.objects.bulk_update(batch, ['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_article_content_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_compressed',
+            field=core.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # the old column is nullable while it is removed, and filled
+        # again before it isn't when going back
+        migrations.AlterField(
+            model_name='article',
+            name='content',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(compress_contents, decompress_contents),
+        migrations.RemoveField(
+            model_name='article',
+            name='content',
+        ),
+        migrations.RenameField(
+            model_name='article',
+            old_name='content_compressed',
+            new_name='content',
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='content',
+            field=core.fields.CompressedTextField(),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.4 on 2026-10-19 18:40
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_comments(apps, schema_editor):
+    # Counts were kept by the comment views only, comments deleted in the
+    # admin or with their user left them too high
+    Article = apps.get_model('core', 'Article')
+    Comment = apps.get_model('core', 'Comment')
+    comment_counts = Comment.objects.filter(article=OuterRef('pk')).\
+        order_by().values('article').annotate(count=Count('id')).values('count')
+    Article.objects.update(comment_count=Coalesce(Subquery(comment_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_compressed_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_comments, migrations.RunPython.noop),
+    ]
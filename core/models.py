@@ -1,6 +1,10 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 from taggit.managers import TaggableManager
+from taggit.models import TagBase, TaggedItemBase
+from core.fields import CompressedTextField
+from core.rendering import content_hash, render_content
+from core.tags import ArticleTagsManager, normalize_tag
 
 
 def validate_image(image):
@@ -11,21 +15,156 @@ def validate_image(image):
         raise ValidationError(f"Maximum size of the image is {limit_mb} MB")
 
 
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    # First words of the content, cut on a word boundary
+    content = ' '.join(content.split())
+    if len(content) <= length:
+        return content
+    return content[:length - 1].rsplit(' ', 1)[0] + '\u2026'
+
+
+# Columns shown on article cards in lists, everything but the content
+CARD_FIELDS = [
+    'id', 'title', 'excerpt', 'image', 'times_read', 'pub_date',
+    'author__id', 'author__username', 'author__user_image',
+]
+
+
+# Fields of articles read only when asked for, see ArticleManager
+DEFERRED_FIELDS = ['content', 'content_html']
+
+
+def card_fields(prefix=''):
+    """
+    CARD_FIELDS as seen from a model related to Article, for use with only():
+    Reaction.objects.select_related('article').only(*card_fields('article'))
+    """
+    if not prefix:
+        return list(CARD_FIELDS)
+    return [f'{prefix}__{field}' for field in CARD_FIELDS]
+
+
+class ArticleQuerySet(models.QuerySet):
+
+    def only(self, *fields):
+        # contents are deferred by the manager, and stay deferred when
+        # named in only() unless that is undone first
+        if set(fields) & set(DEFERRED_FIELDS):
+            self = self.defer(None)
+        return super().only(*fields)
+
+    def cards(self):
+        """
+        Articles with only what cards in lists show: no content,
+        the author's name and image, and tags in one more query
+        """
+        return self.select_related('author').\
+            prefetch_related('tags').\
+            only(*CARD_FIELDS)
+
+
+class ArticleManager(models.Manager.from_queryset(ArticleQuerySet)):
+    """
+    Articles without their content, which can be large and is stored
+    compressed, nor its HTML, about as large: they are read the first
+    time they are accessed, or with the rows when a query asks for them
+    (only('content'), defer(None) or values('content_html')). Pages
+    showing the HTML read it through core.repository.get_content_html.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*DEFERRED_FIELDS)
+
+
+class Tag(TagBase):
+    """
+    Tag of articles, looked up by its normalized key (see core.tags)
+    """
+    key = models.CharField(max_length=100, unique=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.key = normalize_tag(self.name)
+        super().save(*args, **kwargs)
+
+
+class ArticleTaggedItem(TaggedItemBase):
+    """
+    Link between an article and a tag, with a real foreign key to the
+    article instead of taggit's generic content type and object id
+    """
+    tag = models.ForeignKey('core.Tag', on_delete=models.CASCADE, related_name='tagged_articles')
+    content_object = models.ForeignKey('core.Article', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # also the index used to read the tags of articles
+            models.UniqueConstraint(fields=['content_object', 'tag'],
+                                    name='core_tagged_article_tag_uniq'),
+        ]
+        indexes = [
+            # articles with a tag
+            models.Index(fields=['tag', 'content_object'], name='core_tagged_tag_article_idx'),
+        ]
+
+
 class Article(models.Model):
     title = models.CharField(max_length=255, null=False)
-    content = models.TextField()
+    # read only when accessed, see ArticleManager
+    content = CompressedTextField()
     author = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
     image = models.ImageField(
         upload_to='core/images', null=False, validators=[validate_image]
     )
     times_read = models.BigIntegerField(default=0)
     tags = TaggableManager(
+        through=ArticleTaggedItem,
+        manager=ArticleTagsManager,
         help_text='Use comma to separate tags, # is not needed to add tag')
     pub_date = models.DateTimeField(auto_now_add=True)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    # content rendered to HTML when saved, see core.rendering;
+    # read only when accessed too
+    content_html = models.TextField(blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Kept up to date by the Comment signals in core.signals
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ArticleManager()
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        article = super().from_db(db, field_names, values)
+        # to tell renames from other saves, such as those counting reads
+        article._loaded_title = article.__dict__.get('title')
+        return article
+
+    def save(self, *args, **kwargs):
+        # content may be deferred, then it isn't being changed
+        if 'content' in self.__dict__:
+            self.excerpt = make_excerpt(self.content)
+            self.word_count = len(self.content.split())
+            self.render_content()
+        super().save(*args, **kwargs)
+
+    def render_content(self):
+        """
+        Renders the content to HTML unless it was already, returns
+        whether it had to
+        """
+        current_hash = content_hash(self.content)
+        if self.content_hash == current_hash and 'content_html' in self.__dict__:
+            return False
+        self.content_html = render_content(self.content)
+        self.content_hash = current_hash
+        return True
+
 
 class SocialMedia(models.Model):
     FACEBOOK = 'FB'
@@ -65,12 +204,80 @@ class Reaction(models.Model):
     reaction_date = models.DateTimeField(auto_now_add=True)
 
 
+# Comments are threaded by a materialized path: the ids of the comment's
+# ancestors and its own, zero padded and each followed by PATH_SEPARATOR,
+# so that ordering by path lists every thread depth first, in the order
+# its comments were published
+PATH_SEGMENT_LENGTH = 10
+PATH_SEPARATOR = '/'
+MAX_COMMENT_DEPTH = 10
+
+
+def path_segment(pk):
+    return f'{pk:0{PATH_SEGMENT_LENGTH}d}{PATH_SEPARATOR}'
+
+
+def path_end(path):
+    # Smallest string greater than path and every path starting with it
+    return path[:-1] + chr(ord(PATH_SEPARATOR) + 1)
+
+
+class CommentQuerySet(models.QuerySet):
+
+    def subtree(self, comment):
+        """
+        The comment and all replies to it, however deep
+        """
+        return self.filter(article_id=comment.article_id,
+                           path__startswith=comment.path)
+
+    def threads(self, roots):
+        """
+        Given consecutive top-level comments of an article, ordered by path,
+        returns them with all their replies in thread order, in one range
+        scan of the (article, path) index
+        """
+        return self.filter(article_id=roots[0].article_id,
+                           path__gte=roots[0].path,
+                           path__lt=path_end(roots[-1].path)).\
+            order_by('path')
+
+
 class Comment(models.Model):
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
     article = models.ForeignKey('core.Article', on_delete=models.CASCADE)
     content = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(auto_now=True)
+    parent = models.ForeignKey('self', null=True, blank=True, editable=False,
+                               on_delete=models.CASCADE, related_name='replies')
+    path = models.CharField(max_length=255, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['article', 'path'], name='core_comment_thread_idx'),
+        ]
+
+    @property
+    def root_path(self):
+        # Path of the top-level comment of the thread
+        return self.path[:len(path_segment(0))]
+
+    @property
+    def can_be_replied(self):
+        return self.depth < MAX_COMMENT_DEPTH - 1
+
+    def save(self, *args, **kwargs):
+        if self.parent_id and self._state.adding:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if not self.path:
+            # The path ends with the comment's own id, known only now
+            self.path = (self.parent.path if self.parent_id else '') + path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
 
 
 class UserReading(models.Model):
@@ -78,6 +285,51 @@ class UserReading(models.Model):
     article = models.ForeignKey('core.Article', on_delete=models.CASCADE)
     date_read = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # reading history is paginated by (date_read, id) per user
+            models.Index(fields=['user', 'date_read', 'id'],
+                         name='core_reading_user_date_idx'),
+        ]
+
+
+class ArticleDailyReads(models.Model):
+    """
+    Readings of an article on one day, rolled up from UserReading rows
+    older than the retention horizon (see compactreadings command)
+    """
+    article = models.ForeignKey('core.Article', on_delete=models.CASCADE)
+    day = models.DateField()
+    reads = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'day'],
+                                    name='core_daily_reads_article_day_uniq'),
+        ]
+
+
+class UserMonthlyReadings(models.Model):
+    """
+    Days a user read an article on in one month, rolled up from UserReading
+    rows older than the retention horizon (see compactreadings command)
+    """
+    user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
+    article = models.ForeignKey('core.Article', on_delete=models.CASCADE)
+    month = models.DateField(help_text='First day of the month')
+    reads = models.PositiveIntegerField(default=0)
+    last_read = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'article', 'month'],
+                                    name='core_monthly_readings_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'last_read', 'id'],
+                         name='core_monthly_user_last_idx'),
+        ]
+
 
 class Subscription(models.Model):
     subscriber = models.ForeignKey(
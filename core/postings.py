@@ -0,0 +1,147 @@
+"""
+Posting lists of tags: the ids of the articles having a tag, as sorted
+arrays of 64 bit integers, cached by tag in the default cache.
+
+Boolean tag queries (see parse_tag_query) are answered from them in
+memory, without joining the tag tables, and only the articles shown are
+then read from the database. Lists are built with one query for all the
+tags missing from the cache, and cached under the version of the tag's
+articles (see core.versions), bumped when articles are tagged or
+untagged: a list is never patched, a changed tag has its list built
+again from the database the next time it is needed.
+"""
+
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from django.core.cache import cache
+from core.models import ArticleTaggedItem
+from core.tags import normalize_tag
+from core.versions import get_versions
+
+
+POSTINGS_TIMEOUT = 60 * 60
+
+# A tag query is made of tags ("#python"), tags to exclude ("-#php") and
+# "|" between tags any of which will do: "#python | #django #web -#php"
+TAG_QUERY = re.compile(r'\s*(?:(\|)|(-?)[#%]((?:[^#%|-]|-(?![#%]))*))')
+
+
+def postings_keys(tag_ids):
+    # the versions of all the tags are read at once
+    versions = get_versions(*(('tag-articles', tag_id) for tag_id in tag_ids))
+    return {tag_id: f'postings:{tag_id}:{version}' for tag_id, version in zip(tag_ids, versions)}
+
+
+def get_postings(tag_ids):
+    """
+    Posting lists of the given tags, by tag id
+    """
+    keys = postings_keys(list(set(tag_ids)))
+    found = cache.get_many(list(keys.values()))
+    postings = {tag_id: found[key] for tag_id, key in keys.items() if key in found}
+    missing = keys.keys() - postings.keys()
+    if missing:
+        built = {tag_id: array('q') for tag_id in missing}
+        links = ArticleTaggedItem.objects.\
+            filter(tag_id__in=missing).\
+            order_by('tag_id', 'content_object_id').\
+            values_list('tag_id', 'content_object_id')
+        for tag_id, article_id in links:
+            built[tag_id].append(article_id)
+        cache.set_many({keys[tag_id]: ids for tag_id, ids in built.items()}, POSTINGS_TIMEOUT)
+        postings.update(built)
+    return postings
+
+
+def contains(postings, article_id):
+    i = bisect_left(postings, article_id)
+    return i < len(postings) and postings[i] == article_id
+
+
+def intersect(lists):
+    if not lists:
+        return array('q')
+    smallest, *others = sorted(lists, key=len)
+    return array('q', (article_id for article_id in smallest
+                       if all(contains(other, article_id) for other in others)))
+
+
+def union(lists):
+    # merging sorted lists keeps them sorted, groupby drops duplicates
+    return array('q', (article_id for article_id, _ in groupby(heapq.merge(*lists))))
+
+
+def difference(postings, excluded):
+    return array('q', (article_id for article_id in postings
+                       if not contains(excluded, article_id)))
+
+
+class TagQuery:
+    """
+    Parsed tag query: groups of tag keys of which articles must have at
+    least one tag each, and keys of tags articles must not have
+    """
+
+    def __init__(self, groups, excluded):
+        self.groups = groups
+        self.excluded = excluded
+
+    @property
+    def keys(self):
+        return {key for group in self.groups for key in group} | set(self.excluded)
+
+    @property
+    def is_single_tag(self):
+        return len(self.groups) == 1 and len(self.groups[0]) == 1 and not self.excluded
+
+    def evaluate(self, tag_ids):
+        """
+        Ids of the matching articles, newest first, given the ids of the
+        query's tags by key (tags that don't exist are missing from it)
+        """
+        postings = get_postings(tag_ids.values())
+        result = intersect([
+            union([postings[tag_ids[key]] for key in group if key in tag_ids])
+            for group in self.groups
+        ])
+        excluded = [postings[tag_ids[key]] for key in self.excluded if key in tag_ids]
+        if excluded:
+            result = difference(result, union(excluded))
+        result.reverse()
+        return result
+
+
+def parse_tag_query(query):
+    """
+    Returns the TagQuery written in query, or None if query isn't made of
+    tags only or has no tag to look for
+    """
+    groups, excluded = [], []
+    position = 0
+    join = False
+    query = query.strip()
+    while position < len(query):
+        match = TAG_QUERY.match(query, position)
+        if not match or match.end() == position:
+            return None
+        position = match.end()
+        bar, exclude, name = match.groups()
+        if bar:
+            join = True
+            continue
+        key = normalize_tag(name or '')
+        if not key:
+            return None
+        if exclude:
+            excluded.append(key)
+        elif join and groups:
+            groups[-1].append(key)
+        else:
+            groups.append([key])
+        join = False
+    if not groups:
+        return None
+    return TagQuery(groups, excluded)
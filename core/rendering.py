@@ -0,0 +1,77 @@
+"""
+Rendering of article content to HTML.
+
+Articles are written in Markdown, rendered and sanitized once, when they
+are saved (see Article.save), and pages show the stored HTML as it is.
+The hash of the source and of RENDERER_VERSION is stored with it, so
+that saving an article without changing its content renders nothing,
+and the rendercontent command finds the articles to render again after
+the renderer changes. Articles saved before content was rendered have
+no HTML until that command runs, they are shown as plain text
+paragraphs meanwhile (render_text).
+
+Markdown needs both the markdown and bleach packages, which are imported
+on first use rather than when a process starts. Without either of them
+content is rendered as plain text paragraphs: Markdown without a
+sanitizer would let authors put any HTML in pages.
+"""
+
+import hashlib
+from functools import lru_cache
+from django.utils.html import linebreaks
+
+
+# Changing how content is rendered needs a new version
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ['extra', 'sane_lists']
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'blockquote', 'br', 'code', 'dd', 'del', 'dl', 'dt', 'em', 'h1', 'h2',
+    'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'pre', 'strong', 'sub', 'sup', 'table',
+    'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'abbr': ['title'],
+    'th': ['align'],
+    'td': ['align'],
+}
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto'}
+
+
+@lru_cache(maxsize=None)
+def markdown_available():
+    try:
+        import bleach  # noqa: F401
+        import markdown  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def content_hash(content):
+    # content rendered as text is rendered again once Markdown is available
+    renderer = 'markdown' if markdown_available() else 'text'
+    return hashlib.sha256(f'{RENDERER_VERSION}:{renderer}:{content}'.encode()).hexdigest()
+
+
+def render_markdown(content):
+    import bleach
+    import markdown
+    from bleach.callbacks import nofollow, target_blank
+    html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS, output_format='html')
+    html = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                        protocols=ALLOWED_PROTOCOLS, strip=True)
+    # links lead out of the site
+    return bleach.linkify(html, callbacks=[nofollow, target_blank])
+
+
+def render_text(content):
+    return linebreaks(content, autoescape=True)
+
+
+def render_content(content):
+    if markdown_available():
+        return render_markdown(content)
+    return render_text(content)
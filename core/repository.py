@@ -0,0 +1,126 @@
+"""
+Articles by id, for views.
+
+Views look articles up with get_article() rather than each with its own
+query. Within a request every lookup of an article gives the same
+instance, kept in an identity map that IdentityMapMiddleware empties
+when the request ends; outside of requests (commands, workers) there is
+no map and every lookup goes to the cache.
+
+Across requests articles are cached for ARTICLE_TIMEOUT seconds, with
+their author, under a key holding the version of the article (see
+core.versions), and served only while the version of their author is
+the one they were cached with. Changes to either, including the counters
+updated with update(), which bump the article themselves, are then seen
+by the next request.
+
+Articles come with their author and without their content and its
+HTML (see ArticleManager). get_content_html() reads the HTML for the
+pages showing it, cached apart from articles under the version of the
+article as well.
+"""
+
+import threading
+from django.core.cache import cache
+from core.models import Article
+from core.rendering import render_text
+from core.versions import get_version, instance, make_key
+
+
+ARTICLE_TIMEOUT = 60
+
+_local = threading.local()
+
+
+def _identity_map():
+    return getattr(_local, 'articles', None)
+
+
+def start_request():
+    _local.articles = {}
+
+
+def end_request():
+    _local.articles = None
+
+
+def _load(pk, with_content_html):
+    articles = Article.objects.select_related('author')
+    if with_content_html:
+        articles = articles.defer(None).defer('content')
+    article = articles.filter(pk=pk).first()
+    if article is None:
+        return None
+    return article, get_version(instance(article.author))
+
+
+def _cached(pk, with_content_html):
+    # the version is read before the article, so that a change made
+    # while it is loaded leaves the entry under an old key
+    key = make_key('article', instance(Article, pk))
+    html_key = make_key('article-html', instance(Article, pk)) if with_content_html else None
+    entry = cache.get(key)
+    if entry is not None:
+        article, author_version = entry
+        if get_version(instance(article.author)) == author_version:
+            return article
+    entry = _load(pk, with_content_html)
+    if entry is None:
+        return None
+    article = entry[0]
+    # the HTML read with the article is cached apart from it
+    html = article.__dict__.pop('content_html', None)
+    cache.set(key, entry, ARTICLE_TIMEOUT)
+    if html is not None:
+        cache.set(html_key, html, ARTICLE_TIMEOUT)
+        article.content_html = html
+    return article
+
+
+def get_article(pk, with_content_html=False):
+    """
+    The article with the given id, or None. with_content_html reads the
+    HTML of its content too, with the article when it isn't cached.
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    articles = _identity_map()
+    if articles is None:
+        article = _cached(pk, with_content_html)
+    else:
+        if pk not in articles:
+            articles[pk] = _cached(pk, with_content_html)
+        article = articles[pk]
+    if article is not None and with_content_html:
+        get_content_html(article)
+    return article
+
+
+def forget_article(pk):
+    """
+    Drops the article from the identity map of the request, if any
+    """
+    articles = _identity_map()
+    if articles is not None:
+        articles.pop(pk, None)
+
+
+def get_content_html(article):
+    """
+    The HTML of the article's content, which is read, or taken from the
+    cache, only the first time it is asked for
+    """
+    if 'content_html' not in article.__dict__:
+        key = make_key('article-html', instance(article))
+        html = cache.get(key)
+        if html is None:
+            html = Article.objects.filter(pk=article.pk).\
+                values_list('content_html', flat=True).first() or ''
+            cache.set(key, html, ARTICLE_TIMEOUT)
+        article.content_html = html
+    if not article.content_html:
+        # not rendered yet, see the rendercontent command
+        return render_text(article.content)
+    return article.content_html
@@ -0,0 +1,155 @@
+"""
+Cache of search results.
+
+Queries are normalized first: text is casefolded with whitespace
+collapsed, tag queries are rewritten from their parsed form (see
+core.postings), so "Django  Tips" and "django tips", or "#Pop Music" and
+"#pop-music", share their results. Results are cached as arrays of
+article ids in their order, and only the page shown is read from the
+database.
+
+Text results are cached under a version counter of their own query.
+Saving an article or a user bumps the counters of the cached queries
+found in its new or former title or username; queries cached by any
+process are listed in a registry kept in the shared cache. Tag results
+are versioned on their tags' articles.
+
+Text queries finding nothing fall back to similar titles and names (see
+core.trigrams). Their results are cached under the version of the query
+too, and of the articles, since a new or renamed article may be similar
+to a query without containing it.
+
+Keys are namespaced by query class ('search-text', 'search-similar',
+'search-tags'), which is how cache stats report hit rates (see
+core.views.CacheStatsView).
+"""
+
+import hashlib
+import time
+from array import array
+from django.core.cache import cache
+from django.db.models import Q
+from core import trigrams
+from core.models import Article, Tag
+from core.postings import parse_tag_query
+from core.tags import tag_ids_by_key
+from core.versions import bump, make_key, versions_cache
+
+
+SEARCH_TIMEOUT = 5 * 60
+# Longest list of results kept for a query
+MAX_RESULTS = 1000
+# Most queries listed in the registry, the ones expiring first are dropped
+MAX_REGISTERED = 2000
+REGISTRY_KEY = 'search-registry'
+
+
+def normalize_query(query):
+    return ' '.join(query.casefold().split())
+
+
+def normalize_tag_query(tag_query):
+    groups = ' '.join('|'.join(f'#{key}' for key in group) for group in tag_query.groups)
+    excluded = ' '.join(f'-#{key}' for key in tag_query.excluded)
+    return f'{groups} {excluded}'.strip()
+
+
+def query_digest(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def register(normalized):
+    """
+    Lists a query in the registry until its results expire
+    """
+    registry_cache = versions_cache()
+    registry = registry_cache.get(REGISTRY_KEY) or {}
+    now = time.time()
+    registry = {query: expires_at for query, expires_at in registry.items() if expires_at > now}
+    registry[normalized] = now + SEARCH_TIMEOUT
+    if len(registry) > MAX_REGISTERED:
+        kept = sorted(registry.items(), key=lambda item: item[1])[-MAX_REGISTERED:]
+        registry = dict(kept)
+    # Updates made meanwhile by other processes may be lost, their
+    # queries then only expire
+    registry_cache.set(REGISTRY_KEY, registry, SEARCH_TIMEOUT)
+
+
+def invalidate_matching(*texts):
+    """
+    Bumps the cached text queries found in any of texts
+    """
+    texts = [normalize_query(text) for text in texts if text]
+    if not texts:
+        return
+    registry = versions_cache().get(REGISTRY_KEY) or {}
+    now = time.time()
+    bump(*(('search', query_digest(query)) for query, expires_at in registry.items()
+           if expires_at > now and any(query in text for text in texts)))
+
+
+def _query_results(namespace, normalized, compute, *versions):
+    digest = query_digest(normalized)
+    key = make_key(namespace, ('search', digest), *versions, parts=(digest, ))
+
+    def compute_and_register():
+        register(normalized)
+        return array('q', compute()[:MAX_RESULTS])
+
+    return cache.get_or_recompute(key, compute_and_register, SEARCH_TIMEOUT)
+
+
+def text_results(normalized, compute):
+    """
+    Ids of the articles found for a normalized text query, compute()
+    giving them when they aren't cached
+    """
+    return _query_results('search-text', normalized, compute)
+
+
+def similar_results(normalized, compute):
+    """
+    Ids of the articles similar to a normalized text query finding
+    nothing, compute() giving them when they aren't cached
+    """
+    return _query_results('search-similar', normalized, compute, ('articles', ))
+
+
+def tag_results(tag_query, tag_ids, compute):
+    """
+    Ids of the articles matching a tag query, given the ids of its tags
+    by key, compute() giving them when they aren't cached
+    """
+    normalized = normalize_tag_query(tag_query)
+    digest = query_digest(normalized)
+    key = make_key('search-tags', *(('tag-articles', tag_id) for tag_id in sorted(tag_ids.values())),
+                   parts=(digest, ))
+    return cache.get_or_recompute(key, compute, SEARCH_TIMEOUT)
+
+
+def text_article_ids(normalized):
+    return list(Article.objects.
+                filter(Q(title__icontains=normalized) | Q(author__username__icontains=normalized)).
+                order_by('-times_read').
+                values_list('id', flat=True)[:MAX_RESULTS])
+
+
+def find_articles(query, tag_query=None):
+    """
+    Ids of the articles found for a query, as a (match, ids) pair where
+    match tells how they were found: 'tags' for tag queries, 'text' for
+    titles and authors' names containing the query, 'similar' when none
+    does. Queries of tags without a letter or a digit find nothing.
+    """
+    tag_query = tag_query or parse_tag_query(query)
+    if tag_query:
+        # The matching ids are found from posting lists in memory
+        tag_ids = tag_ids_by_key(Tag, tag_query.keys)
+        return 'tags', tag_results(tag_query, tag_ids, lambda: tag_query.evaluate(tag_ids))
+    if query.strip()[:1] in ('#', '%'):
+        return 'tags', array('q')
+    normalized = normalize_query(query)
+    article_ids = text_results(normalized, lambda: text_article_ids(normalized))
+    if article_ids:
+        return 'text', article_ids
+    return 'similar', similar_results(normalized, lambda: trigrams.similar_article_ids(normalized))
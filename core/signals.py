@@ -0,0 +1,232 @@
+"""
+Bumps version counters (see core.versions) whenever the data they cover
+changes. DEPENDENCIES lists, for each model, the counters that a saved
+or deleted row of it affects.
+
+Also keeps up to date the comment counts of articles, and the caches
+that versions don't cover: tag ids by key, the typeahead and trigram
+indexes, the identity map of articles of the request, and bumps cached
+searches matching renamed articles and users.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from users.models import CustomUser
+from core.models import Article, SocialMedia, UserDescription, FavoriteArticles, \
+    Reaction, Comment, UserReading, UserMonthlyReadings, Subscription, Tag
+from core import repository, search, trigrams, typeahead
+from core.tags import TAG_IDS
+from core.versions import bump, instance
+
+
+DEPENDENCIES = {
+    Article: lambda article: [
+        instance(article), ('author-articles', article.author_id), ('articles',)],
+    # ('users',) is only bumped by renames, see user_renamed
+    CustomUser: lambda user: [instance(user)],
+    Tag: lambda tag: [instance(tag), ('tag-articles', tag.pk), ('tags',)],
+    Subscription: lambda subscription: [
+        ('subscribers', subscription.subscribe_to_id),
+        ('subscriptions', subscription.subscriber_id)],
+    Reaction: lambda reaction: [
+        ('article-reactions', reaction.article_id), ('user-reactions', reaction.user_id)],
+    Comment: lambda comment: [('article-comments', comment.article_id)],
+    UserReading: lambda reading: [('user-readings', reading.user_id)],
+    UserMonthlyReadings: lambda readings: [('user-readings', readings.user_id)],
+    FavoriteArticles: lambda favorite: [('favorites', favorite.user_id)],
+    UserDescription: lambda description: [('user-profile', description.user_id)],
+    SocialMedia: lambda social_media: [('user-profile', social_media.user_id)],
+    # Rows linking articles to tags, removed by cascades
+    # without going through the tags manager
+    Article.tags.through: lambda tagged_item: [
+        ('article', tagged_item.content_object_id), ('tag-articles', tagged_item.tag_id), ('tags',)],
+}
+
+
+def bump_dependencies(sender, instance, **kwargs):
+    bump(*DEPENDENCIES[sender](instance))
+
+
+for model in DEPENDENCIES:
+    post_save.connect(bump_dependencies, sender=model,
+                      dispatch_uid=f'versions-save-{model._meta.label_lower}')
+    post_delete.connect(bump_dependencies, sender=model,
+                        dispatch_uid=f'versions-delete-{model._meta.label_lower}')
+
+
+@receiver(m2m_changed, sender=Article.tags.through, dispatch_uid='versions-article-tags')
+def bump_article_tags(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # the tags being cleared are only known before they are
+        instance._tag_ids_before_clear = set(
+            instance.tags.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_tag_ids_before_clear', set())
+    bump(('article', instance.pk), ('tags',),
+         *(('tag-articles', tag_id) for tag_id in pk_set))
+
+
+@receiver(m2m_changed, sender=FavoriteArticles.articles.through, dispatch_uid='versions-favorites')
+def bump_favorites(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump(('favorites', instance.user_id))
+        return
+    # instance is an article, removed from or added to several users' favorites
+    favorites = FavoriteArticles.objects.all()
+    if action != 'pre_clear':
+        favorites = favorites.filter(pk__in=pk_set)
+    else:
+        favorites = favorites.filter(articles=instance)
+    bump(*(('favorites', user_id) for user_id in favorites.values_list('user_id', flat=True)))
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='comment-count-save')
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        Article.objects.filter(pk=instance.article_id).\
+            update(comment_count=F('comment_count') + 1)
+        # update() doesn't send post_save
+        bump(('article', instance.article_id))
+
+
+@receiver(post_delete, sender=Comment, dispatch_uid='comment-count-delete')
+def uncount_comment(sender, instance, **kwargs):
+    # sent for every comment deleted, by the views, the admin, or with
+    # the comment they reply to, their article or their user
+    Article.objects.filter(pk=instance.article_id).\
+        update(comment_count=Greatest(F('comment_count') - 1, 0))
+    bump(('article', instance.article_id))
+
+
+@receiver([post_save, post_delete], sender=Tag, dispatch_uid='tag-ids')
+def forget_tag_ids(sender, **kwargs):
+    # keys of renamed or deleted tags would resolve to the wrong tag or none
+    TAG_IDS.clear()
+
+
+def update_typeahead(update):
+    # a process that never served suggestions has no index to keep
+    if typeahead.INDEX.is_built:
+        transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Article, dispatch_uid='typeahead-article-save')
+def index_article(sender, instance, **kwargs):
+    update_typeahead(lambda: typeahead.INDEX.put(
+        'article', instance.pk, instance.title, instance.times_read))
+
+
+@receiver(post_save, sender=CustomUser, dispatch_uid='typeahead-user-save')
+def index_author(sender, instance, **kwargs):
+    if instance.is_active and not instance.is_superuser:
+        update_typeahead(lambda: typeahead.INDEX.put('author', instance.pk, instance.username))
+    else:
+        update_typeahead(lambda: typeahead.INDEX.discard('author', instance.pk))
+
+
+@receiver(post_save, sender=Tag, dispatch_uid='typeahead-tag-save')
+def index_tag(sender, instance, **kwargs):
+    update_typeahead(lambda: typeahead.INDEX.put(
+        'tag', instance.pk, instance.name, value=instance.key))
+
+
+@receiver(post_delete, sender=Article, dispatch_uid='typeahead-article-delete')
+@receiver(post_delete, sender=CustomUser, dispatch_uid='typeahead-user-delete')
+@receiver(post_delete, sender=Tag, dispatch_uid='typeahead-tag-delete')
+def unindex(sender, instance, **kwargs):
+    kind = {Article: 'article', CustomUser: 'author', Tag: 'tag'}[sender]
+    update_typeahead(lambda: typeahead.INDEX.discard(kind, instance.pk))
+
+
+@receiver(post_save, sender=Subscription, dispatch_uid='typeahead-subscription-save')
+def count_subscriber(sender, instance, created, **kwargs):
+    if created:
+        update_typeahead(lambda: typeahead.INDEX.add_popularity(
+            'author', instance.subscribe_to_id, 1))
+
+
+@receiver(post_delete, sender=Subscription, dispatch_uid='typeahead-subscription-delete')
+def uncount_subscriber(sender, instance, **kwargs):
+    update_typeahead(lambda: typeahead.INDEX.add_popularity(
+        'author', instance.subscribe_to_id, -1))
+
+
+@receiver(m2m_changed, sender=Article.tags.through, dispatch_uid='typeahead-article-tags')
+def count_tagged_articles(sender, action, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        update_typeahead(lambda: typeahead.tags_used(pk_set))
+
+
+@receiver(post_delete, sender=Article.tags.through, dispatch_uid='typeahead-tagged-item-delete')
+def uncount_tagged_article(sender, instance, **kwargs):
+    update_typeahead(lambda: typeahead.INDEX.add_popularity('tag', instance.tag_id, -1))
+
+
+def update_trigrams(update):
+    if trigrams.INDEX.is_built:
+        transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Article, dispatch_uid='trigrams-article-save')
+def index_article_trigrams(sender, instance, created, **kwargs):
+    if 'title' in instance.__dict__:
+        update_trigrams(lambda: trigrams.INDEX.put('article', instance.pk, instance.title))
+    if created and ('author', instance.author_id) not in trigrams.INDEX:
+        # the first article of its author
+        update_trigrams(lambda: trigrams.INDEX.put(
+            'author', instance.author_id, instance.author.username))
+
+
+@receiver(post_save, sender=CustomUser, dispatch_uid='trigrams-user-save')
+def index_author_trigrams(sender, instance, **kwargs):
+    # only authors with articles are indexed
+    if ('author', instance.pk) in trigrams.INDEX:
+        update_trigrams(lambda: trigrams.INDEX.put('author', instance.pk, instance.username))
+
+
+@receiver(post_delete, sender=Article, dispatch_uid='trigrams-article-delete')
+@receiver(post_delete, sender=CustomUser, dispatch_uid='trigrams-user-delete')
+def unindex_trigrams(sender, instance, **kwargs):
+    kind = 'article' if sender is Article else 'author'
+    update_trigrams(lambda: trigrams.INDEX.discard(kind, instance.pk))
+
+
+@receiver(post_save, sender=Article, dispatch_uid='search-article-save')
+def invalidate_article_searches(sender, instance, created, **kwargs):
+    if 'title' not in instance.__dict__:
+        return
+    loaded_title = getattr(instance, '_loaded_title', None)
+    if not created and instance.title == loaded_title:
+        return
+    texts = [instance.title, loaded_title]
+    if created:
+        # new articles are also found by their author's name
+        texts.append(instance.author.username)
+    search.invalidate_matching(*texts)
+    instance._loaded_title = instance.title
+
+
+@receiver(post_save, sender=CustomUser, dispatch_uid='users-rename')
+def user_renamed(sender, instance, created, **kwargs):
+    # most saves of users, such as the one of last_login at every login,
+    # change nothing lists and searches show of them
+    loaded_username = getattr(instance, '_loaded_username', None)
+    if 'username' not in instance.__dict__ or instance.username == loaded_username:
+        return
+    bump(('users',))
+    if not created:
+        search.invalidate_matching(instance.username, loaded_username)
+    instance._loaded_username = instance.username
+
+
+@receiver(post_delete, sender=Article, dispatch_uid='repository-article-delete')
+def forget_deleted_article(sender, instance, **kwargs):
+    repository.forget_article(instance.pk)
@@ -0,0 +1,69 @@
+"""
+Media storage importing the cloudinary SDK on first use.
+
+django_cleanup resolves the storage of every file field when apps are
+ready, so with MediaCloudinaryStorage as the default storage every
+process (workers, management commands, migrations) imported the SDK
+during django.setup(). MediaStorage hands every call over to a
+MediaCloudinaryStorage created the first time a file is stored, opened
+or linked to. Preloaded web servers create it before forking (see
+articlee.warmup.load_storage), the others when a page first shows media.
+"""
+
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+
+@deconstructible
+class MediaStorage(Storage):
+
+    @cached_property
+    def backend(self):
+        from cloudinary_storage.storage import MediaCloudinaryStorage
+        return MediaCloudinaryStorage()
+
+    def open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def save(self, name, content, max_length=None):
+        return self.backend.save(name, content, max_length)
+
+    def get_valid_name(self, name):
+        return self.backend.get_valid_name(name)
+
+    def get_alternative_name(self, file_root, file_ext):
+        return self.backend.get_alternative_name(file_root, file_ext)
+
+    def get_available_name(self, name, max_length=None):
+        return self.backend.get_available_name(name, max_length)
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def delete(self, name):
+        return self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
@@ -0,0 +1,175 @@
+"""
+Tags of articles are told apart by their key: the name lowercased, with
+runs of whitespace, hyphens and slashes folded into a single hyphen. Tags
+typed as "Pop music", "pop-music" or "#pop  music" in a search are all the
+same tag, and looking one up is a probe of the unique index on the key.
+
+Article.tags writes in batches: setting the tags of an article resolves
+all names at once, through a process cache of tag ids by key, creates the
+missing tags with one insert, then adds and removes links with one
+statement each, whatever the number of tags.
+"""
+
+import re
+import time
+from django.db import IntegrityError, router, transaction
+from django.db.models import signals
+from django.utils.text import slugify
+from taggit.managers import _TaggableManager
+from taggit.utils import require_instance_manager
+from core.cache import LocalLRU
+
+
+SEPARATORS = re.compile(r'[\s/-]+')
+
+# Ids of tags by key. Renamed and deleted tags are forgotten by the
+# process they were changed in (see core.signals), other processes
+# forget them after TAG_IDS_TIMEOUT seconds at most
+TAG_IDS = LocalLRU(max_entries=10000)
+TAG_IDS_TIMEOUT = 300
+
+
+def normalize_tag(name):
+    return SEPARATORS.sub('-', name.lower()).strip('-')
+
+
+def remember_tag_ids(ids):
+    expires_at = time.time() + TAG_IDS_TIMEOUT
+    for key, tag_id in ids.items():
+        TAG_IDS.set(key, tag_id, expires_at)
+
+
+def tag_ids_by_key(tag_model, keys, using=None):
+    """
+    Ids of the existing tags with the given keys, by key
+    """
+    ids = {}
+    for key in keys:
+        tag_id = TAG_IDS.get(key)
+        if tag_id is not None:
+            ids[key] = tag_id
+    missing = set(keys) - ids.keys()
+    if missing:
+        found = dict(tag_model._default_manager.using(using).
+                     filter(key__in=missing).values_list('key', 'id'))
+        remember_tag_ids(found)
+        ids.update(found)
+    return ids
+
+
+class ArticleTagsManager(_TaggableManager):
+    """
+    Manager of Article.tags resolving tag names by key
+    """
+
+    def _split_tags(self, tags):
+        # Tag objects, and the names of the others by key
+        tag_model = self.through.tag_model()
+        tag_objs = set()
+        names = {}
+        for tag in tags:
+            if isinstance(tag, tag_model):
+                tag_objs.add(tag)
+            elif isinstance(tag, str):
+                # Names made of separators only have no key and are dropped
+                key = normalize_tag(tag)
+                if key:
+                    names.setdefault(key, tag.strip())
+            else:
+                raise ValueError(
+                    f'Cannot add {tag} ({type(tag)}). Expected {tag_model} or str.')
+        return tag_objs, names
+
+    def _to_tag_model_instances(self, tags, tag_kwargs):
+        tag_objs, names = self._split_tags(tags)
+        db = router.db_for_write(self.through, instance=self.instance)
+        manager = self.through.tag_model()._default_manager.using(db)
+        existing = list(manager.filter(key__in=names, **tag_kwargs))
+        tag_objs.update(existing)
+        for key in names.keys() - {tag.key for tag in existing}:
+            tag, _ = manager.get_or_create(key=key, **tag_kwargs,
+                                           defaults={'name': names[key]})
+            tag_objs.add(tag)
+        return tag_objs
+
+    def _resolve_ids(self, names, db):
+        """
+        Ids of the tags with the given keys, creating the missing ones
+        """
+        tag_model = self.through.tag_model()
+        ids = tag_ids_by_key(tag_model, names, using=db)
+        to_create = names.keys() - ids.keys()
+        if not to_create:
+            return ids
+
+        manager = tag_model._default_manager.using(db)
+        # Tags someone else creates meanwhile, or whose slug is taken,
+        # are skipped by the insert and created one by one below
+        manager.bulk_create([
+            tag_model(name=names[key], key=key, slug=slugify(key, allow_unicode=True))
+            for key in to_create
+        ], ignore_conflicts=True)
+        created = dict(manager.filter(key__in=to_create).values_list('key', 'id'))
+        for key in to_create - created.keys():
+            tag, _ = manager.get_or_create(key=key, defaults={'name': names[key]})
+            created[key] = tag.id
+        remember_tag_ids(created)
+        ids.update(created)
+        return ids
+
+    def _tag_ids(self, tags, db):
+        tag_objs, names = self._split_tags(tags)
+        return {tag.pk for tag in tag_objs} | set(self._resolve_ids(names, db).values())
+
+    def _current_ids(self, db):
+        return set(self.through._default_manager.using(db).
+                   filter(**self._lookup_kwargs()).values_list('tag_id', flat=True))
+
+    def _send_changed(self, action, pk_set, db):
+        signals.m2m_changed.send(
+            sender=self.through, action=action, instance=self.instance,
+            reverse=False, model=self.through.tag_model(), pk_set=pk_set, using=db)
+
+    def _write(self, tags, db, through_defaults, replace):
+        new_ids = self._tag_ids(tags, db)
+        current_ids = self._current_ids(db)
+        to_remove = current_ids - new_ids if replace else set()
+        to_add = new_ids - current_ids
+        links = self.through._default_manager.using(db)
+        if to_remove:
+            self._send_changed('pre_remove', to_remove, db)
+            links.filter(**self._lookup_kwargs(), tag_id__in=to_remove).delete()
+            self._send_changed('post_remove', to_remove, db)
+        if to_add:
+            self._send_changed('pre_add', to_add, db)
+            links.bulk_create([
+                self.through(**self._lookup_kwargs(), tag_id=tag_id, **(through_defaults or {}))
+                for tag_id in to_add
+            ])
+            self._send_changed('post_add', to_add, db)
+
+    def _write_batched(self, tags, through_defaults, replace):
+        self._remove_prefetched_objects()
+        db = router.db_for_write(self.through, instance=self.instance)
+        try:
+            with transaction.atomic(using=db):
+                self._write(tags, db, through_defaults, replace)
+        except IntegrityError:
+            # A cached id of a tag deleted by another process, or links
+            # written by someone else meanwhile: start over from the database
+            TAG_IDS.clear()
+            with transaction.atomic(using=db):
+                self._write(tags, db, through_defaults, replace)
+
+    @require_instance_manager
+    def add(self, *tags, through_defaults=None, tag_kwargs=None, **kwargs):
+        if tag_kwargs:
+            return super().add(*tags, through_defaults=through_defaults,
+                               tag_kwargs=tag_kwargs, **kwargs)
+        self._write_batched(tags, through_defaults, replace=False)
+
+    @require_instance_manager
+    def set(self, tags, *, through_defaults=None, **kwargs):
+        if kwargs.get('clear') or kwargs.get('tag_kwargs'):
+            return super().set(tags, through_defaults=through_defaults, **kwargs)
+        self._write_batched(tags, through_defaults, replace=True)
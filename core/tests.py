@@ -0,0 +1,583 @@
+import itertools
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import caches
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from users.models import CustomUser
+from core import postings, trigrams
+from core.cache import Envelope, TwoTierCache
+from core.models import Article, ArticleTaggedItem, Comment, FavoriteArticles, Reaction, \
+    SocialMedia, Subscription, Tag, UserReading, path_segment
+from core.tags import TAG_IDS
+from core.versions import get_version
+from core.trigrams import TrigramIndex
+from core.typeahead import LIMITS, PrefixIndex
+
+
+_locations = itertools.count()
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'core-tests-shared'},
+}
+
+
+def make_worker_cache(lock_timeout=5):
+    # a cache of its own process tier, on the shared tier of the tests
+    return TwoTierCache(f'core-tests-{next(_locations)}', {
+        'OPTIONS': {'SHARED_ALIAS': 'shared', 'LOCK_TIMEOUT': lock_timeout},
+    })
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GetOrRecomputeTests(SimpleTestCase):
+    """
+    Concurrency of TwoTierCache.get_or_recompute, with threads standing
+    in for the threads and processes of workers
+    """
+
+    def setUp(self):
+        caches['shared'].clear()
+        # every test gets a process tier of its own
+        self.cache = self.make_cache()
+
+    def make_cache(self, lock_timeout=5):
+        return make_worker_cache(lock_timeout)
+
+    def same_stripe_keys(self, cache):
+        first = 'stripe:0'
+        for i in itertools.count(1):
+            key = f'stripe:{i}'
+            if cache._recompute_lock(key) is cache._recompute_lock(first):
+                return first, key
+
+    def start(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def blocking_compute(self, value):
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return value
+        return compute, started, release
+
+    def put_expired(self, key, value):
+        # a value about to expire is always recomputed early
+        self.cache.set(key, Envelope(value, 1.0, time.time()), 60)
+
+    def test_computes_and_caches_a_missing_value(self):
+        self.assertEqual(self.cache.get_or_recompute('key', lambda: 'value', 60), 'value')
+        self.assertEqual(self.cache.get_or_recompute('key', lambda: 'other', 60), 'value')
+        self.assertFalse(caches['shared'].has_key('lock:key'))
+
+    def test_slow_computation_does_not_hold_up_keys_of_its_stripe(self):
+        slow_key, other_key = self.same_stripe_keys(self.cache)
+        compute, started, release = self.blocking_compute('slow')
+        self.addCleanup(release.set)
+        self.start(lambda: self.cache.get_or_recompute(slow_key, compute, 60))
+        self.assertTrue(started.wait(5))
+        results = []
+        thread = self.start(lambda: results.append(
+            self.cache.get_or_recompute(other_key, lambda: 'other', 60)))
+        thread.join(1)
+        release.set()
+        self.assertEqual(results, ['other'])
+
+    def test_stale_value_is_served_while_recomputed(self):
+        self.put_expired('key', 'stale')
+        compute, started, release = self.blocking_compute('fresh')
+        self.addCleanup(release.set)
+        self.start(lambda: self.cache.get_or_recompute('key', compute, 60))
+        self.assertTrue(started.wait(5))
+        results = []
+        thread = self.start(lambda: results.append(
+            self.cache.get_or_recompute('key', lambda: 'parallel', 60)))
+        thread.join(1)
+        release.set()
+        self.assertEqual(results, ['stale'])
+
+    def test_missing_value_is_waited_for_and_computed_once(self):
+        calls = []
+        compute, started, release = self.blocking_compute('value')
+
+        def counted_compute():
+            calls.append(1)
+            return compute()
+        results = []
+        threads = [self.start(lambda: results.append(
+            self.cache.get_or_recompute('key', counted_compute, 60))) for _ in range(4)]
+        self.assertTrue(started.wait(5))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiter_that_times_out_leaves_the_lock_of_its_holder(self):
+        cache = self.make_cache(lock_timeout=0.2)
+        caches['shared'].add('lock:key', 'holder', 60)
+        self.assertEqual(cache.get_or_recompute('key', lambda: 'value', 60), 'value')
+        self.assertEqual(caches['shared'].get('lock:key'), 'holder')
+
+    def test_expired_lock_taken_by_another_is_not_released(self):
+        def compute():
+            # the lock of this computation expired, another one took it
+            caches['shared'].set('lock:key', 'other', 60)
+            return 'value'
+        self.assertEqual(self.cache.get_or_recompute('key', compute, 60), 'value')
+        self.assertEqual(caches['shared'].get('lock:key'), 'other')
+
+
+class TrigramIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.load([('article', 1, 'Learning Django'),
+                         ('article', 2, 'Django tips'),
+                         ('article', 3, 'Django'),
+                         ('article', 4, 'Cooking pasta'),
+                         ('author', 1, 'django')])
+
+    def test_best_matches_come_first_closest_in_length_on_ties(self):
+        matches = self.index.search('djnago')
+        self.assertEqual([(kind, pk) for kind, pk, _ in matches],
+                         [('article', 3), ('author', 1), ('article', 2), ('article', 1)])
+
+    def test_only_limit_matches_are_given(self):
+        self.assertEqual([(kind, pk) for kind, pk, _ in self.index.search('djnago', limit=2)],
+                         [('article', 3), ('author', 1)])
+
+    def test_updated_and_discarded_entries_match_their_new_text_only(self):
+        self.index.put('article', 3, 'Cooking rice')
+        self.index.discard('author', 1)
+        self.assertEqual([(kind, pk) for kind, pk, _ in self.index.search('djnago')],
+                         [('article', 2), ('article', 1)])
+        self.assertEqual([pk for _, pk, _ in self.index.search('cookin rice')], [3, 4])
+        self.assertEqual(len(self.index), 4)
+
+
+class PrefixIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.load([('article', 1, 'Django tips', 5, None),
+                         ('article', 2, 'Django forms', 3, None),
+                         ('article', 3, 'Django admin', 1, None)])
+
+    def ids(self, prefix, limit=10):
+        return [pk for _, pk, _, _ in self.index.search(prefix, limit)]
+
+    def test_least_popular_entry_makes_room_when_a_kind_is_full(self):
+        with mock.patch.dict(LIMITS, {'article': 3}):
+            self.index.add_popularity('article', 3, 10)
+            self.index.put('article', 4, 'Django signals', 4)
+            self.assertNotIn(('article', 2), self.index._entries)
+            # less popular than every entry left
+            self.index.put('article', 5, 'Django models', 0)
+            self.assertNotIn(('article', 5), self.index._entries)
+        self.assertEqual(self.ids('django'), [3, 1, 4])
+
+    def test_popularity_changes_reorder_short_prefixes(self):
+        self.assertEqual(self.ids('dj'), [1, 2, 3])
+        self.index.add_popularity('article', 3, 10)
+        self.index.put('article', 1, 'Django tips', 0)
+        # another limit, lookups are remembered for a few seconds
+        self.assertEqual(self.ids('dj', limit=5), [3, 2, 1])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PostingsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com')
+        cls.articles = [Article.objects.create(title=f'Article {i}', content='Content',
+                                               author=author, image='core/images/seed.jpg')
+                        for i in range(3)]
+        cls.tag = Tag.objects.create(name='django', slug='django')
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def tag_article(self, article):
+        with self.captureOnCommitCallbacks(execute=True):
+            ArticleTaggedItem.objects.create(tag=self.tag, content_object=article)
+
+    def postings_of(self, worker):
+        with mock.patch.object(postings, 'cache', worker):
+            return list(postings.get_postings([self.tag.pk])[self.tag.pk])
+
+    def test_workers_see_articles_tagged_by_each_other(self):
+        first, second = make_worker_cache(), make_worker_cache()
+        self.tag_article(self.articles[0])
+        # both have the list in their process tier
+        self.postings_of(first)
+        self.postings_of(second)
+        with mock.patch.object(postings, 'cache', first):
+            self.tag_article(self.articles[1])
+        with mock.patch.object(postings, 'cache', second):
+            self.tag_article(self.articles[2])
+        ids = [article.pk for article in self.articles]
+        self.assertEqual(self.postings_of(first), ids)
+        self.assertEqual(self.postings_of(second), ids)
+
+    def test_untagged_article_leaves_the_list(self):
+        worker = make_worker_cache()
+        self.tag_article(self.articles[0])
+        self.tag_article(self.articles[1])
+        self.assertEqual(len(self.postings_of(worker)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles[0].delete()
+        self.assertEqual(self.postings_of(worker), [self.articles[1].pk])
+
+
+@override_settings(CACHES=TEST_CACHES,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UsersVersionTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = CustomUser.objects.create_user(
+                username='reader', email='reader@example.com', password='secret')
+
+    def users_version_after(self, change):
+        before = get_version(('users', ))
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return before, get_version(('users', ))
+
+    def test_login_leaves_lists_of_users_alone(self):
+        before, after = self.users_version_after(
+            lambda: self.assertTrue(self.client.login(username='reader', password='secret')))
+        self.assertEqual(before, after)
+
+    def test_rename_is_seen_by_lists_of_users(self):
+        def rename():
+            user = CustomUser.objects.get(pk=self.user.pk)
+            user.username = 'renamed'
+            user.save()
+        before, after = self.users_version_after(rename)
+        self.assertNotEqual(before, after)
+
+
+# Query budgets of views: each view runs as many queries however much data
+# it shows. Every measurement starts from cold caches, in a private cache,
+# with storages that don't need cloudinary credentials or a collected
+# static manifest.
+SMALL = 10
+# more rows than any page shows
+LARGE = 200
+
+MEASUREMENT_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {'SHARED_ALIAS': 'shared'},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'core-tests-budgets',
+        },
+    },
+    'DEFAULT_FILE_STORAGE': 'django.core.files.storage.FileSystemStorage',
+    'STATICFILES_STORAGE': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+
+def create_users(n, prefix):
+    return CustomUser.objects.bulk_create([
+        CustomUser(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com',
+                   password='!')
+        for i in range(n)
+    ])
+
+
+def create_articles(author, n, title='Seeded article'):
+    # rendered as saving them would, once since they share their content
+    rendered = Article(content='Seeded content ' * 50)
+    rendered.render_content()
+    articles = [
+        Article(title=f'{title} {i}', content=rendered.content, content_html=rendered.content_html,
+                content_hash=rendered.content_hash, author=author, image='core/images/seed.jpg')
+        for i in range(n)
+    ]
+    return Article.objects.bulk_create(articles)
+
+
+def tag_articles(articles, tags):
+    ArticleTaggedItem.objects.bulk_create([
+        ArticleTaggedItem(tag=tag, content_object=article)
+        for article in articles for tag in tags
+    ])
+
+
+class Fixture:
+    """
+    Rows every scenario starts from: a reader who is logged in,
+    an author with one tagged article, and a staff user for admin pages
+    """
+
+    def __init__(self):
+        self.reader = CustomUser.objects.create_user(
+            username='budget_reader', email='reader@example.com', password='password')
+        self.author = CustomUser.objects.create_user(
+            username='budget_author', email='author@example.com', password='password')
+        self.staff = CustomUser.objects.create_superuser(
+            username='budget_staff', email='staff@example.com', password='password')
+        self.tag = Tag.objects.create(name='budget', slug='budget')
+        self.article = create_articles(self.author, 1, title='Budget article')[0]
+        tag_articles([self.article], [self.tag])
+
+
+def seed_article_detail(fixture, n):
+    users = create_users(n, 'reactor')
+    Reaction.objects.bulk_create([
+        Reaction(user=user, article=fixture.article, value=1 if i % 2 else -1)
+        for i, user in enumerate(users)
+    ])
+    Subscription.objects.bulk_create([
+        Subscription(subscriber=user, subscribe_to=fixture.author)
+        for user in users
+    ])
+    favorite = FavoriteArticles.objects.create(user=fixture.reader)
+    favorite.articles.add(fixture.article,
+                          *create_articles(fixture.author, n, title='Favorite'))
+    tag_articles([fixture.article],
+                 Tag.objects.bulk_create([Tag(name=f'detail{i}', slug=f'detail{i}', key=f'detail{i}')
+                                          for i in range(n)]))
+
+
+def seed_article_read(fixture, n):
+    seed_article_detail(fixture, n)
+    UserReading.objects.bulk_create([
+        UserReading(user=fixture.reader, article=fixture.article,
+                    date_read=timezone.now() - timedelta(days=i + 1))
+        for i in range(n)
+    ])
+
+
+def seed_tagged_articles(fixture, n):
+    tags = Tag.objects.bulk_create([Tag(name=f'extra{i}', slug=f'extra{i}', key=f'extra{i}')
+                                    for i in range(3)])
+    tag_articles(create_articles(fixture.author, n), [fixture.tag, *tags])
+
+
+def seed_tag_query(fixture, n):
+    odd, other = Tag.objects.bulk_create([Tag(name=name, slug=name, key=name)
+                                          for name in ('odd', 'other')])
+    articles = create_articles(fixture.author, n)
+    tag_articles(articles, [fixture.tag])
+    tag_articles(articles[::2], [odd])
+    tag_articles(create_articles(fixture.author, n), [other])
+
+
+def seed_search_results(fixture, n):
+    create_articles(fixture.author, n, title='Needle')
+
+
+def seed_author_articles(fixture, n):
+    tag_articles(create_articles(fixture.author, n), [fixture.tag])
+
+
+def seed_subscribers(fixture, n):
+    Subscription.objects.bulk_create([
+        Subscription(subscriber=user, subscribe_to=fixture.author)
+        for user in create_users(n, 'subscriber')
+    ])
+
+
+def seed_social_media(fixture, n):
+    SocialMedia.objects.bulk_create([
+        SocialMedia(user=fixture.author, title=SocialMedia.TWITTER,
+                    link=f'https://twitter.com/budget{i}')
+        for i in range(n)
+    ])
+    Article.objects.filter(author=fixture.author).update(times_read=n)
+
+
+def create_comments(comments):
+    # bulk_create skips Comment.save(), paths are filled here
+    comments = Comment.objects.bulk_create(comments)
+    for comment in comments:
+        comment.path = (comment.parent.path if comment.parent_id else '') + path_segment(comment.pk)
+    Comment.objects.bulk_update(comments, ['path'])
+    return comments
+
+
+def seed_comments(fixture, n):
+    users = create_users(n, 'commenter')
+    roots = create_comments([
+        Comment(user=user, article=fixture.article, content='Seeded comment')
+        for user in users
+    ])
+    # and a reply to every thread
+    create_comments([
+        Comment(user=user, article=fixture.article, parent=root, depth=1, content='Seeded reply')
+        for user, root in zip(reversed(users), roots)
+    ])
+    Article.objects.filter(pk=fixture.article.pk).update(comment_count=2 * n)
+
+
+def seed_reading_history(fixture, n):
+    articles = create_articles(fixture.author, n)
+    UserReading.objects.bulk_create([
+        UserReading(user=fixture.reader, article=article,
+                    date_read=timezone.now() - timedelta(hours=i))
+        for i, article in enumerate(articles)
+    ])
+
+
+def seed_tagged_reading_history(fixture, n):
+    articles = create_articles(fixture.author, n)
+    tag_articles(articles, [fixture.tag])
+    UserReading.objects.bulk_create([
+        UserReading(user=fixture.reader, article=article,
+                    date_read=timezone.now() - timedelta(hours=i))
+        for i, article in enumerate(articles)
+    ])
+
+
+def seed_favorites(fixture, n):
+    articles = create_articles(fixture.author, n)
+    tag_articles(articles, [fixture.tag])
+    favorite = FavoriteArticles.objects.create(user=fixture.reader)
+    favorite.articles.add(*articles)
+
+
+def seed_reactions(fixture, n):
+    Reaction.objects.bulk_create([
+        Reaction(user=fixture.reader, article=article, value=1 if i % 2 else -1)
+        for i, article in enumerate(create_articles(fixture.author, 2 * n))
+    ])
+
+
+def seed_subscriptions(fixture, n):
+    Subscription.objects.bulk_create([
+        Subscription(subscriber=fixture.reader, subscribe_to=user)
+        for user in create_users(n, 'followed')
+    ])
+
+
+def seed_own_articles(fixture, n):
+    tag_articles(create_articles(fixture.reader, n), [fixture.tag])
+
+
+def seed_tags(fixture, n):
+    tags = Tag.objects.bulk_create([Tag(name=f'index{i}', slug=f'index{i}', key=f'index{i}')
+                                    for i in range(n)])
+    tag_articles([fixture.article], tags)
+
+
+def seed_admin_comments(fixture, n):
+    Comment.objects.bulk_create([
+        Comment(user=fixture.reader, article=article, content='Seeded comment')
+        for article in create_articles(fixture.author, n)
+    ])
+
+
+class Scenario:
+
+    def __init__(self, name, url, seed, queries, method='get', user='reader', data=None,
+                 last_page_queries=0):
+        self.name = name
+        self.url = url
+        self.seed = seed
+        self.queries = queries
+        # Queries run only by the last page of a list, which SMALL rows
+        # fit in and LARGE ones don't
+        self.last_page_queries = last_page_queries
+        self.method = method
+        self.user = user
+        self.data = data or {}
+
+
+# Number of queries each view runs, with SMALL rows as with LARGE ones,
+# but for the queries only its last page runs.
+SCENARIOS = [
+    Scenario('index', lambda f: reverse('core:index'), seed_tags, 3),
+    Scenario('article-detail', lambda f: reverse('public:article-detail', args=(f.article.id,)),
+             seed_article_detail, 11),
+    Scenario('article-detail-read', lambda f: reverse('public:article-detail', args=(f.article.id,)),
+             seed_article_read, 14, method='post'),
+    Scenario('read-article', lambda f: reverse('public:read-article', args=(f.article.id,)),
+             seed_article_read, 6, method='post'),
+    Scenario('articles-by-tag', lambda f: reverse('public:articles-tag', args=(f.tag.key,)),
+             seed_tagged_articles, 5),
+    Scenario('search', lambda f: reverse('public:search'), seed_search_results, 5,
+             data={'query': 'needle'}),
+    Scenario('fuzzy-search', lambda f: reverse('public:search'), seed_search_results, 5,
+             data={'query': 'neddle'}),
+    Scenario('tag-query', lambda f: reverse('public:search'), seed_tag_query, 6,
+             data={'query': '#budget | #other -#odd'}),
+    Scenario('articles-by-author', lambda f: reverse('public:articles-by-author', args=(f.author.id,)),
+             seed_author_articles, 5),
+    Scenario('author-page', lambda f: reverse('public:author-page', args=(f.author.id,)),
+             seed_subscribers, 4),
+    Scenario('public-about-page', lambda f: reverse('public:about-page', args=(f.author.id,)),
+             seed_social_media, 4),
+    Scenario('article-comments', lambda f: reverse('public:article-comments', args=(f.article.id,)),
+             seed_comments, 6),
+    Scenario('reading-history', lambda f: reverse('personal:reading-history'),
+             seed_reading_history, 4, last_page_queries=1),
+    Scenario('reading-history-filtered', lambda f: reverse('personal:reading-history'),
+             seed_tagged_reading_history, 6, last_page_queries=1,
+             data=lambda f: {'tag': f.tag.key, 'author': f.author.id}),
+    Scenario('favorite-articles', lambda f: reverse('personal:favorite-articles'),
+             seed_favorites, 5),
+    Scenario('liked-articles', lambda f: reverse('personal:liked-articles'), seed_reactions, 3),
+    Scenario('disliked-articles', lambda f: reverse('personal:disliked-articles'), seed_reactions, 3),
+    Scenario('subscriptions', lambda f: reverse('personal:subscriptions-list'),
+             seed_subscriptions, 3),
+    Scenario('articles-list', lambda f: reverse('personal:articles-list'), seed_own_articles, 4),
+    Scenario('api-articles', lambda f: reverse('api:v1-articles'), seed_author_articles, 3,
+             data={'limit': 100}),
+    Scenario('api-tag-articles', lambda f: reverse('api:v1-articles'), seed_tagged_articles, 4,
+             data=lambda f: {'tag': f.tag.key, 'limit': 100}),
+    Scenario('api-search', lambda f: reverse('api:v1-search'), seed_search_results, 3,
+             data={'query': 'needle', 'limit': 100}),
+    Scenario('admin-articles', lambda f: reverse('admin:core_article_changelist'),
+             seed_author_articles, 9, user='staff'),
+    Scenario('admin-comments', lambda f: reverse('admin:core_comment_changelist'),
+             seed_admin_comments, 7, user='staff'),
+]
+
+
+@override_settings(**MEASUREMENT_SETTINGS)
+class QueryBudgetTests(TestCase):
+
+    def assertQueryBudget(self, scenario):
+        for size, queries in ((SMALL, scenario.queries),
+                              (LARGE, scenario.queries - scenario.last_page_queries)):
+            with self.subTest(size=size), transaction.atomic():
+                fixture = Fixture()
+                scenario.seed(fixture, size)
+                self.client.force_login(getattr(fixture, scenario.user))
+                for cache in caches.all():
+                    cache.clear()
+                TAG_IDS.clear()
+                # as built when the worker started
+                trigrams.build()
+                request = getattr(self.client, scenario.method)
+                data = scenario.data(fixture) if callable(scenario.data) else scenario.data
+                with self.assertNumQueries(queries):
+                    response = request(scenario.url(fixture), data)
+                self.assertLess(response.status_code, 400)
+                transaction.set_rollback(True)
+
+
+for scenario in SCENARIOS:
+    setattr(QueryBudgetTests, f"test_{scenario.name.replace('-', '_')}",
+            lambda self, scenario=scenario: self.assertQueryBudget(scenario))
@@ -0,0 +1,208 @@
+"""
+In-process trigram index of article titles and usernames, for searches
+with typos.
+
+Words are padded the way PostgreSQL's pg_trgm does it ("  word "), and
+cut into trigrams; the index maps every trigram to the entries having
+it. A query is scored against the entries sharing a trigram with it by
+the share of its trigrams they have, the closer in length first on
+ties, so "djnago" still finds "Learning Django". Only the best
+MAX_MATCHES entries are kept, and only the articles of the page shown
+are read from the database. Results are cached like those of text
+queries (see core.search).
+
+Searches only fall back to it when exact matching finds nothing (see
+public.views.SearchArticlesView). Like the typeahead index (see
+core.typeahead), it is built on first use or when a worker starts, kept
+up to date by the signals of the process and rebuilt in the background
+every REBUILD_INTERVAL seconds.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from users.models import CustomUser
+from core.models import Article
+
+
+logger = logging.getLogger(__name__)
+
+WORDS = re.compile(r'\w+')
+# Entries kept by kind, the most read articles and authors with articles
+LIMITS = {'article': 30000, 'author': 10000}
+# Least share of the query's trigrams an entry must have
+THRESHOLD = 0.4
+MAX_MATCHES = 50
+# Most read articles given for every matching author
+ARTICLES_PER_AUTHOR = 10
+REBUILD_INTERVAL = 10 * 60
+
+
+def trigrams(text):
+    found = set()
+    for word in WORDS.findall(text.casefold()):
+        padded = f'  {word} '
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+class TrigramIndex:
+    """
+    Entries are numbered by slot; posting lists are arrays of slots, and
+    all an entry keeps besides its key is its number of trigrams. An
+    entry updated or discarded leaves its slot unused, still listed in
+    postings, until the index is built again.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []
+        self._sizes = array('H')
+        self._slots = {}
+        self._postings = {}
+        self.built_at = None
+        self._rebuilding = False
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _add(self, key, grams):
+        slot = len(self._keys)
+        self._keys.append(key)
+        self._sizes.append(min(len(grams), 0xffff))
+        self._slots[key] = slot
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('i')
+            postings.append(slot)
+
+    def _delete(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._keys[slot] = None
+
+    def put(self, kind, pk, text):
+        grams = trigrams(text)
+        with self._lock:
+            self._delete((kind, pk))
+            self._add((kind, pk), grams)
+
+    def discard(self, kind, pk):
+        with self._lock:
+            self._delete((kind, pk))
+
+    def search(self, query, limit=MAX_MATCHES, threshold=THRESHOLD):
+        """
+        The limit entries most similar to query, as (kind, id, score)
+        tuples, best first
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = Counter()
+        with self._lock:
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            keys, sizes = self._keys, self._sizes
+            least = threshold * len(grams)
+            candidates = [(slot, count) for slot, count in shared.items()
+                          if count >= least and keys[slot] is not None]
+            matches = heapq.nsmallest(limit, candidates, key=lambda candidate: (
+                -candidate[1], abs(sizes[candidate[0]] - len(grams)), keys[candidate[0]]))
+            return [(*keys[slot], count / len(grams)) for slot, count in matches]
+
+    def load(self, rows):
+        """
+        Replaces the content of the index with (kind, id, text) rows
+        """
+        index = TrigramIndex()
+        for kind, pk, text in rows:
+            index._add((kind, pk), trigrams(text))
+        with self._lock:
+            self._keys, self._sizes = index._keys, index._sizes
+            self._slots, self._postings = index._slots, index._postings
+            self.built_at = time.monotonic()
+
+
+INDEX = TrigramIndex()
+
+
+def index_rows():
+    articles = Article.objects.order_by('-times_read').\
+        values_list('id', 'title')[:LIMITS['article']]
+    authors = CustomUser.objects.filter(article__isnull=False).\
+        distinct().\
+        order_by('id').\
+        values_list('id', 'username')[:LIMITS['author']]
+    rows = [('article', pk, title) for pk, title in articles]
+    rows += [('author', pk, username) for pk, username in authors]
+    return rows
+
+
+def build():
+    started = time.monotonic()
+    INDEX.load(index_rows())
+    logger.info('Built trigram index of %d entries in %.3fs',
+                len(INDEX), time.monotonic() - started)
+    return len(INDEX)
+
+
+def _rebuild_in_background():
+    try:
+        build()
+    except Exception:
+        logger.exception('Could not rebuild trigram index')
+    finally:
+        INDEX._rebuilding = False
+        # the thread's own connection
+        connection.close()
+
+
+def get_index():
+    if not INDEX.is_built:
+        with INDEX._lock:
+            if not INDEX.is_built:
+                build()
+    elif time.monotonic() - INDEX.built_at > REBUILD_INTERVAL and not INDEX._rebuilding:
+        INDEX._rebuilding = True
+        threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return INDEX
+
+
+def similar_article_ids(query, limit=MAX_MATCHES):
+    """
+    Ids of the articles whose title or author's name is similar to query,
+    best match first, and the ARTICLES_PER_AUTHOR most read articles of
+    an author
+    """
+    matches = get_index().search(query, limit)
+    author_ids = [pk for kind, pk, _ in matches if kind == 'author']
+    by_author = {}
+    if author_ids:
+        articles = Article.objects.filter(author_id__in=author_ids).\
+            annotate(rank=Window(RowNumber(), partition_by=F('author_id'),
+                                 order_by=[F('times_read').desc(), F('id')])).\
+            filter(rank__lte=ARTICLES_PER_AUTHOR).\
+            order_by('author_id', 'rank')
+        for pk, author_id in articles.values_list('id', 'author_id'):
+            by_author.setdefault(author_id, []).append(pk)
+    article_ids = []
+    for kind, pk, _ in matches:
+        article_ids.extend(by_author.get(pk, ()) if kind == 'author' else [pk])
+    # an article can match by its title and its author
+    return list(dict.fromkeys(article_ids))
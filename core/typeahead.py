@@ -0,0 +1,309 @@
+"""
+In-process prefix index for search suggestions.
+
+Articles (by title), authors (by username) and tags (by name) are kept
+in a sorted list of (term, kind, id), where terms are the casefolded
+name and the rest of it from each of its first few words on, so that
+"dj" suggests "Learning Django". A prefix is looked up with two bisects,
+and the matches ranked by popularity: times read for articles,
+subscribers for authors, tagged articles for tags. Prefixes of up to
+SHORT_PREFIX characters match too much of the index to be ranked on
+every lookup, their best entries are kept until one under them changes.
+
+Every kind holds at most LIMITS[kind] entries, the most popular ones;
+the least popular of a kind is found from a heap of the popularities of
+its entries, which may hold outdated ones until they come on top.
+The index is built when a worker starts (see articlee.warmup) or on first
+use, kept up to date by the signals of the process (see core.signals),
+and rebuilt in the background every REBUILD_INTERVAL seconds to pick up
+what other processes changed.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from django.db import connection
+from django.db.models import Count
+from users.models import CustomUser
+from core.models import Article, Tag
+
+
+logger = logging.getLogger(__name__)
+
+LIMITS = {'article': 30000, 'author': 10000, 'tag': 10000}
+WORDS_INDEXED = 4
+SHORT_PREFIX = 2
+MAX_SUGGESTIONS = 20
+REBUILD_INTERVAL = 10 * 60
+# Results of recent lookups are reused for this long
+MEMO_TIMEOUT = 10
+MEMO_MAX_ENTRIES = 2000
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def terms_of(label):
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:]) for i in range(min(len(words), WORDS_INDEXED))}
+
+
+class Entry:
+    __slots__ = ('label', 'popularity', 'value', 'terms')
+
+    def __init__(self, label, popularity, value, terms):
+        self.label = label
+        self.popularity = popularity
+        self.value = value
+        self.terms = terms
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._terms = []
+        self._entries = {}
+        self._counts = dict.fromkeys(LIMITS, 0)
+        self._heaps = {kind: [] for kind in LIMITS}
+        self._memo = {}
+        self._top = {}
+        self.built_at = None
+        self._rebuilding = False
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, kind, pk, label, popularity, value):
+        terms = terms_of(label)
+        self._entries[(kind, pk)] = Entry(label, popularity, value, terms)
+        self._counts[kind] += 1
+        self._push(kind, pk, popularity)
+        for term in terms:
+            insort(self._terms, (term, kind, pk))
+        self._forget_top(terms)
+
+    def _delete(self, kind, pk):
+        entry = self._entries.pop((kind, pk), None)
+        if entry is None:
+            return
+        self._counts[kind] -= 1
+        for term in entry.terms:
+            i = bisect_left(self._terms, (term, kind, pk))
+            if i < len(self._terms) and self._terms[i] == (term, kind, pk):
+                del self._terms[i]
+        self._forget_top(entry.terms)
+
+    def _forget_top(self, terms):
+        for term in terms:
+            for length in range(1, SHORT_PREFIX + 1):
+                self._top.pop(term[:length], None)
+
+    def _push(self, kind, pk, popularity):
+        heap = self._heaps[kind]
+        heapq.heappush(heap, (popularity, pk))
+        if len(heap) > 2 * self._counts[kind] + 64:
+            # mostly outdated, made again from the entries
+            heap[:] = [(entry.popularity, key[1]) for key, entry in self._entries.items()
+                       if key[0] == kind]
+            heapq.heapify(heap)
+
+    def _set_popularity(self, kind, pk, entry, popularity):
+        if entry.popularity != popularity:
+            entry.popularity = popularity
+            self._push(kind, pk, popularity)
+            # the best entries of its short prefixes may have changed
+            self._forget_top(entry.terms)
+
+    def _least_popular(self, kind):
+        heap = self._heaps[kind]
+        while True:
+            popularity, pk = heap[0]
+            entry = self._entries.get((kind, pk))
+            if entry is not None and entry.popularity == popularity:
+                return kind, pk
+            heapq.heappop(heap)
+
+    def put(self, kind, pk, label, popularity=None, value=None):
+        """
+        Adds or updates an entry. Without a popularity, the entry keeps
+        the one it had, or starts from 0.
+        """
+        with self._lock:
+            entry = self._entries.get((kind, pk))
+            if popularity is None:
+                popularity = entry.popularity if entry else 0
+            if entry and entry.label == label:
+                self._set_popularity(kind, pk, entry, popularity)
+                entry.value = value
+                return
+            self._delete(kind, pk)
+            if self._counts[kind] >= LIMITS[kind]:
+                least_popular = self._least_popular(kind)
+                if self._entries[least_popular].popularity >= popularity:
+                    return
+                self._delete(*least_popular)
+            self._insert(kind, pk, label, popularity, value)
+            self._memo.clear()
+
+    def discard(self, kind, pk):
+        with self._lock:
+            if (kind, pk) in self._entries:
+                self._delete(kind, pk)
+                self._memo.clear()
+
+    def add_popularity(self, kind, pk, delta):
+        with self._lock:
+            entry = self._entries.get((kind, pk))
+            if entry:
+                self._set_popularity(kind, pk, entry, entry.popularity + delta)
+
+    def _scan(self, prefix, limit, kinds):
+        start = bisect_left(self._terms, (prefix, ))
+        end = bisect_left(self._terms, (prefix + '\U0010ffff', ))
+        keys = {(kind, pk) for term, kind, pk in self._terms[start:end]
+                if kinds is None or kind in kinds}
+        return heapq.nlargest(limit, keys, key=lambda key: self._entries[key].popularity)
+
+    def _top_keys(self, prefix, kinds):
+        top = self._top.setdefault(prefix, {})
+        if kinds not in top:
+            top[kinds] = self._scan(prefix, MAX_SUGGESTIONS, kinds)
+        return top[kinds]
+
+    def search(self, prefix, limit=10, kinds=None):
+        """
+        The limit most popular entries with a term starting with prefix,
+        as (kind, id, label, value) tuples
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        memo_key = (prefix, limit, kinds)
+        now = time.monotonic()
+        with self._lock:
+            memo = self._memo.get(memo_key)
+            if memo and memo[0] > now:
+                return memo[1]
+            if len(prefix) <= SHORT_PREFIX and limit <= MAX_SUGGESTIONS:
+                best = self._top_keys(prefix, kinds)[:limit]
+            else:
+                best = self._scan(prefix, limit, kinds)
+            results = [(kind, pk, self._entries[(kind, pk)].label, self._entries[(kind, pk)].value)
+                       for kind, pk in best]
+            if len(self._memo) >= MEMO_MAX_ENTRIES:
+                self._memo.clear()
+            self._memo[memo_key] = (now + MEMO_TIMEOUT, results)
+        return results
+
+    def load(self, rows):
+        """
+        Replaces the content of the index with (kind, id, label, popularity, value) rows
+        """
+        entries = {}
+        terms = []
+        counts = dict.fromkeys(LIMITS, 0)
+        heaps = {kind: [] for kind in LIMITS}
+        for kind, pk, label, popularity, value in rows:
+            entry = Entry(label, popularity, value, terms_of(label))
+            entries[(kind, pk)] = entry
+            counts[kind] += 1
+            heaps[kind].append((popularity, pk))
+            terms.extend((term, kind, pk) for term in entry.terms)
+        terms.sort()
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        with self._lock:
+            self._entries, self._terms, self._counts = entries, terms, counts
+            self._heaps = heaps
+            self._memo = {}
+            self._top = {}
+            self.built_at = time.monotonic()
+
+
+INDEX = PrefixIndex()
+
+
+def index_rows():
+    articles = Article.objects.order_by('-times_read').\
+        values_list('id', 'title', 'times_read')[:LIMITS['article']]
+    authors = CustomUser.objects.filter(is_active=True, is_superuser=False).\
+        annotate(subscribers=Count('subscribe_to')).\
+        order_by('-subscribers').\
+        values_list('id', 'username', 'subscribers')[:LIMITS['author']]
+    tags = Tag.objects.annotate(articles=Count('tagged_articles')).\
+        filter(articles__gt=0).\
+        order_by('-articles').\
+        values_list('id', 'name', 'articles', 'key')[:LIMITS['tag']]
+    rows = [('article', pk, title, times_read, None) for pk, title, times_read in articles]
+    rows += [('author', pk, username, subscribers, None) for pk, username, subscribers in authors]
+    rows += [('tag', pk, name, count, key) for pk, name, count, key in tags]
+    return rows
+
+
+def build():
+    started = time.monotonic()
+    INDEX.load(index_rows())
+    logger.info('Built typeahead index of %d entries in %.3fs',
+                len(INDEX), time.monotonic() - started)
+    return len(INDEX)
+
+
+def _rebuild_in_background():
+    try:
+        build()
+    except Exception:
+        logger.exception('Could not rebuild typeahead index')
+    finally:
+        INDEX._rebuilding = False
+        # the thread's own connection
+        connection.close()
+
+
+def get_index():
+    """
+    The index, built now if it never was, and scheduled for a rebuild in
+    the background when it is older than REBUILD_INTERVAL
+    """
+    if not INDEX.is_built:
+        with INDEX._lock:
+            if not INDEX.is_built:
+                build()
+    elif time.monotonic() - INDEX.built_at > REBUILD_INTERVAL and not INDEX._rebuilding:
+        INDEX._rebuilding = True
+        threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return INDEX
+
+
+def tags_used(tag_ids):
+    """
+    Counts a new article for each of the tags, indexing those that
+    weren't, such as tags just created
+    """
+    missing = []
+    for tag_id in tag_ids:
+        if ('tag', tag_id) in INDEX._entries:
+            INDEX.add_popularity('tag', tag_id, 1)
+        else:
+            missing.append(tag_id)
+    for pk, name, key in Tag.objects.filter(pk__in=missing).values_list('id', 'name', 'key'):
+        INDEX.put('tag', pk, name, 1, key)
+
+
+def suggest(query, limit=10):
+    """
+    Suggestions for what is being typed in the search box. Queries
+    starting with '#' or '%' are completed with tags only.
+    """
+    query = query.strip()
+    kinds = None
+    if query[:1] in ('#', '%'):
+        query, kinds = query[1:], ('tag', )
+    return get_index().search(query, limit, kinds)
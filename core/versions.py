@@ -0,0 +1,96 @@
+"""
+Version counters for cache invalidation.
+
+Every model instance and every collection of instances cached anywhere
+has a version counter, named by a tuple such as ('article', 42) or
+('tag-articles', 7). Cache keys embed the current versions of everything
+the cached value was built from, so when something changes its counter
+is bumped (see core.signals) and the keys built from the old version are
+never read again; they simply expire.
+
+Counters live in the shared cache only, the process tier of the default
+cache would hide bumps made by other workers. A counter that is missing
+(never created, or evicted) is started from the current time in
+nanoseconds, so that it can't come back to a value it had before.
+"""
+
+import threading
+import time
+from django.core.cache import caches
+from django.db import transaction
+
+
+VERSIONS_CACHE_ALIAS = 'shared'
+
+_pending = threading.local()
+
+
+def versions_cache():
+    return caches[VERSIONS_CACHE_ALIAS]
+
+
+def version_key(name):
+    return 'version:' + ':'.join(str(part) for part in name)
+
+
+def instance(obj_or_model, pk=None):
+    """
+    Name of the version counter of a model instance, such as ('article', 42)
+    """
+    if pk is None:
+        pk = obj_or_model.pk
+    return (obj_or_model._meta.model_name, pk)
+
+
+def get_versions(*names):
+    cache = versions_cache()
+    keys = [version_key(name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def make_key(prefix, *names, parts=()):
+    """
+    Cache key for a value built from the given version counters,
+    e.g. make_key('author-card', instance(author), ('subscribers', author.pk))
+    """
+    versions = '.'.join(str(version) for version in get_versions(*names))
+    return ':'.join([prefix, *(str(part) for part in parts), versions])
+
+
+def _pending_names():
+    names = getattr(_pending, 'names', None)
+    if names is None:
+        names = _pending.names = set()
+    return names
+
+
+def _flush_pending():
+    names = _pending_names()
+    cache = versions_cache()
+    while names:
+        key = version_key(names.pop())
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def bump(*names):
+    """
+    Bumps the given counters once the current transaction commits, so
+    that nothing can cache the old data under the new version. Bumps of
+    the same counter within a transaction are done once.
+    """
+    _pending_names().update(names)
+    # Callbacks of rolled back transactions are dropped, their names are
+    # then bumped with the next commit, which is harmless
+    transaction.on_commit(_flush_pending)
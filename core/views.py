@@ -1,19 +1,20 @@
 from datetime import timedelta
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.db.models.query_utils import Q
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.views import View
 from django.utils import timezone
-from taggit.models import Tag, TaggedItem
-from core.models import Article, Subscription, FavoriteArticles, UserReading, Reaction
+from core.models import Article, ArticleTaggedItem, Tag, Subscription, FavoriteArticles, UserReading, Reaction
 
 
 class IndexView(View):
     template_name = 'core/index.html'
 
     def get(self, request, *args, **kwargs):
-        tagged_items_ids = [t.tag_id for t in TaggedItem.objects.all()]
         tags = Tag.objects.filter(
-            id__in=tagged_items_ids).all().order_by('name')
+            id__in=ArticleTaggedItem.objects.values('tag_id')).order_by('name')
         return render(request, self.template_name, {'tags': tags})
 
 # class IndexView(View):
@@ -194,6 +195,18 @@ class IndexView(View):
 #                                                     'tags': tags})
 
 
+class CacheStatsView(View):
+    """
+    Hit rates and evictions of this process' cache, by key namespace
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        stats = cache.stats() if hasattr(cache, 'stats') else {}
+        return JsonResponse(stats)
+
+
 def error_404_handler(request, exception):
     return render(request, 'errors/404.html', status=404)
 
@@ -0,0 +1,127 @@
+"""
+Export of everything a user has on the site, as CSV or NDJSON.
+
+Rows are produced lazily, in batches of BATCH_SIZE read by primary key
+(the MySQL driver buffers whole result sets, even through iterator()),
+and encoded as they go, so memory use doesn't depend on the size of
+the account.
+"""
+
+import csv
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from core.models import Article, Comment, FavoriteArticles, Reaction, Subscription, UserReading, \
+    UserMonthlyReadings
+
+
+BATCH_SIZE = 2000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def favorites_queryset(user):
+    return FavoriteArticles.articles.through.objects.filter(favoritearticles__user=user)
+
+
+# For every dataset: the rows of the user and the columns to export
+DATASETS = {
+    'readings': (
+        lambda user: UserReading.objects.filter(user=user),
+        ['id', 'article_id', 'article__title', 'date_read'],
+    ),
+    'monthly_readings': (
+        lambda user: UserMonthlyReadings.objects.filter(user=user),
+        ['id', 'article_id', 'article__title', 'month', 'reads', 'last_read'],
+    ),
+    'reactions': (
+        lambda user: Reaction.objects.filter(user=user),
+        ['id', 'article_id', 'article__title', 'value', 'reaction_date'],
+    ),
+    'favorites': (
+        favorites_queryset,
+        ['id', 'article_id', 'article__title'],
+    ),
+    'comments': (
+        lambda user: Comment.objects.filter(user=user),
+        ['id', 'article_id', 'parent_id', 'content', 'pub_date', 'update_date'],
+    ),
+    'subscriptions': (
+        lambda user: Subscription.objects.filter(subscriber=user),
+        ['id', 'subscribe_to_id', 'subscribe_to__username'],
+    ),
+    'articles': (
+        lambda user: Article.objects.filter(author=user),
+        ['id', 'title', 'content', 'times_read', 'pub_date'],
+    ),
+}
+
+
+def iter_rows(queryset, columns):
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list(*columns)[:BATCH_SIZE])
+        yield from rows
+        if len(rows) < BATCH_SIZE:
+            return
+        last_pk = rows[-1][0]
+
+
+class Echo:
+    # csv.writer needs a file, this one hands back what is written to it
+    def write(self, value):
+        return value
+
+
+def iter_csv(user, dataset):
+    get_queryset, columns = DATASETS[dataset]
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in iter_rows(get_queryset(user), columns):
+        yield writer.writerow(row)
+
+
+def iter_ndjson(user, datasets):
+    encoder = DjangoJSONEncoder()
+    for dataset in datasets:
+        get_queryset, columns = DATASETS[dataset]
+        for row in iter_rows(get_queryset(user), columns):
+            record = {'type': dataset, **dict(zip(columns, row))}
+            yield encoder.encode(record) + '\n'
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(user, export_format, datasets, gzip=False):
+    """
+    Yields the export of the given datasets as bytes. CSV can only hold
+    one dataset, NDJSON records carry the name of theirs in 'type'.
+    """
+    if export_format == 'csv':
+        if len(datasets) != 1:
+            raise ValueError('CSV export holds exactly one dataset')
+        chunks = iter_csv(user, datasets[0])
+    else:
+        chunks = iter_ndjson(user, datasets)
+    chunks = (chunk.encode() for chunk in chunks)
+    if gzip:
+        chunks = gzipped(chunks)
+    return chunks
+
+
+def export_filename(user, export_format, datasets, gzip=False):
+    name = datasets[0] if len(datasets) == 1 else 'data'
+    filename = f'articlee-{user.username}-{name}.{FORMATS[export_format][1]}'
+    return filename + '.gz' if gzip else filename
@@ -0,0 +1,34 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from users.models import CustomUser
+from personal import export
+
+
+class Command(BaseCommand):
+    help = "Exports a user's readings, reactions, favorites, comments, subscriptions and articles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=list(export.FORMATS), default='ndjson')
+        parser.add_argument('--dataset', choices=[*export.DATASETS, 'all'], default='all',
+                            help='CSV exports need a single dataset')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', help='File to write to, standard output by default')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        datasets = list(export.DATASETS) if options['dataset'] == 'all' else [options['dataset']]
+        try:
+            chunks = export.export(user, options['format'], datasets, gzip=options['gzip'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
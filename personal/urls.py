@@ -63,5 +63,7 @@ urlpatterns = [
     path('personal/articles/favorites/<int:pk>/delete/', views.DeleteFavoriteArticle.as_view(),
          name='delete-favorite-article'),
     path('personal/articles/favorites/clear/', views.ClearFavoritesView.as_view(),
-         name='clear-favorites')
+         name='clear-favorites'),
+    # View for downloading all of user's data
+    path('personal/export/', views.ExportDataView.as_view(), name='export-data'),
 ]
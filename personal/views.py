@@ -1,15 +1,21 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models.query_utils import Q
-from django.db.models import Sum
-from django.http import Http404, HttpResponseForbidden
+from django.db.models import Sum, prefetch_related_objects
+from django.http import Http404, HttpResponseForbidden, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import ListView, DetailView
-from core.models import Subscription, Article, SocialMedia, UserDescription, FavoriteArticles, UserReading, Reaction
+from users.models import CustomUser
+from core.models import Subscription, Article, SocialMedia, UserDescription, FavoriteArticles, UserReading, Reaction, \
+    UserMonthlyReadings, Tag, card_fields
+from core import repository
+from core.tags import normalize_tag
 from personal.forms import PublishUpdateArticleForm, PublishSocialMediaForm, PublishUpdateUserDescriptionForm
+from personal import export
 
 
 class PersonalPageView(View):
@@ -53,8 +59,7 @@ class ArticlesListView(ListView):
 
     def get_queryset(self):
         current_user = self.request.user
-        articles = Article.objects.\
-            prefetch_related('tags').\
+        articles = Article.objects.cards().\
             filter(author=current_user).\
             order_by('-pub_date').all()
         return articles
@@ -65,10 +70,17 @@ class ArticlesListView(ListView):
 
 
 class ArticleDetailView(DetailView):
-    queryset = Article.objects.select_related('author').all()
+    model = Article
     template_name = 'personal/article_detail.html'
     context_object_name = 'article'
 
+    def get_object(self, queryset=None):
+        # the page shows the content's HTML
+        article = repository.get_article(self.kwargs['pk'], with_content_html=True)
+        if not article:
+            raise Http404
+        return article
+
     def get(self, request, *args, **kwargs):
         article: Article = self.get_object()
         if article.author.id != request.user.id:
@@ -115,10 +127,11 @@ class UpdateArticleBaseClass(View):
     send_post_to = ''
 
     def get_article(self, pk):
-        return Article.objects.\
-            filter(pk=pk).\
-            prefetch_related('tags').\
-            first()
+        # the content the form shows is read when it is accessed
+        article = repository.get_article(pk)
+        if article:
+            prefetch_related_objects([article], 'tags')
+        return article
 
     def get(self, request, *args, **kwargs):
         article = self.get_article(self.kwargs['pk'])
@@ -180,7 +193,7 @@ class DeleteArticleView(View):
     redirect_to = 'personal:articles-list'
 
     def get_article(self, pk):
-        return Article.objects.filter(pk=pk).first()
+        return repository.get_article(pk)
 
     def post(self, request, *args, **kwargs):
         current_user = request.user
@@ -370,15 +383,107 @@ class DeleteUserDescriptionView(View):
 
 
 class ReadingHistory(View):
+    """
+    Reading history, newest first, grouped by day in the template.
+    Readings older than the retention horizon only exist rolled up by
+    month (UserMonthlyReadings, see compactreadings command); they follow
+    the daily readings once those run out.
+    Pages are found by the (date, id) of the last entry of the previous
+    page rather than by an offset, so every page costs the same however
+    long the history is. Can be narrowed down to the articles of one
+    author ('author' parameter, author's id) or tag ('tag', tag's key).
+    """
     template_name = 'personal/reading_history.html'
+    paginate_by = 50
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    monthly_prefix = 'm'
+
+    def get_cursor(self, value):
+        # cursor is "<microseconds since epoch>-<id>" of the last entry shown,
+        # prefixed with 'm' when it is a monthly one
+        is_monthly = value.startswith(self.monthly_prefix)
+        if is_monthly:
+            value = value[len(self.monthly_prefix):]
+        try:
+            timestamp, pk = (int(part) for part in value.split('-'))
+            date = self.epoch + timedelta(microseconds=timestamp)
+        except (ValueError, OverflowError):
+            return None, False
+        return (date, pk), is_monthly
+
+    def make_cursor(self, date, pk, is_monthly=False):
+        timestamp = (date - self.epoch) // timedelta(microseconds=1)
+        prefix = self.monthly_prefix if is_monthly else ''
+        return f'{prefix}{timestamp}-{pk}'
+
+    def filter_entries(self, entries, user, cursor, author_id, tag_slug, date_field):
+        entries = entries.select_related('article__author').filter(user=user)
+        if author_id:
+            entries = entries.filter(article__author_id=author_id)
+        if tag_slug:
+            entries = entries.filter(article__tags__key=normalize_tag(tag_slug))
+        if cursor:
+            date, pk = cursor
+            entries = entries.filter(
+                Q(**{f'{date_field}__lt': date}) |
+                Q(**{date_field: date, 'id__lt': pk})
+            )
+        return entries.order_by(f'-{date_field}', '-id')
+
+    def get_user_readings(self, user, cursor, author_id, tag_slug, limit):
+        user_readings = UserReading.objects.only('date_read', *card_fields('article'))
+        return self.filter_entries(
+            user_readings, user, cursor, author_id, tag_slug, 'date_read')[:limit]
+
+    def get_monthly_readings(self, user, cursor, author_id, tag_slug, limit):
+        monthly_readings = UserMonthlyReadings.objects.only(
+            'month', 'reads', 'last_read', *card_fields('article'))
+        return self.filter_entries(
+            monthly_readings, user, cursor, author_id, tag_slug, 'last_read')[:limit]
 
     def get(self, request, *args, **kwargs):
         current_user = request.user
-        user_readings = UserReading.objects.\
-            select_related('article').\
-            filter(user=current_user).\
-            order_by('-date_read').all()
-        return render(request, self.template_name, {'user_readings': user_readings})
+        cursor, is_monthly_cursor = self.get_cursor(request.GET.get('before', ''))
+        author_id = request.GET.get('author', '')
+        if not author_id.isdigit():
+            author_id = None
+        tag_slug = request.GET.get('tag') or None
+        user_readings, monthly_readings = [], []
+        next_cursor = None
+        if not is_monthly_cursor:
+            user_readings = list(self.get_user_readings(
+                current_user, cursor, author_id, tag_slug, self.paginate_by + 1))
+            if len(user_readings) > self.paginate_by:
+                user_readings = user_readings[:self.paginate_by]
+                last = user_readings[-1]
+                next_cursor = self.make_cursor(last.date_read, last.id)
+        if next_cursor is None:
+            # Daily readings ran out, the rest of the page is monthly ones
+            remaining = self.paginate_by - len(user_readings)
+            monthly_readings = list(self.get_monthly_readings(
+                current_user, cursor if is_monthly_cursor else None,
+                author_id, tag_slug, remaining + 1))
+            if len(monthly_readings) > remaining:
+                monthly_readings = monthly_readings[:remaining]
+                last = monthly_readings[-1] if monthly_readings else None
+                if last:
+                    next_cursor = self.make_cursor(last.last_read, last.id, is_monthly=True)
+                else:
+                    next_cursor = self.make_cursor(
+                        user_readings[-1].date_read, user_readings[-1].id)
+        next_query = None
+        if next_cursor:
+            params = request.GET.copy()
+            params['before'] = next_cursor
+            next_query = params.urlencode()
+        author = CustomUser.objects.filter(pk=author_id).first() if author_id else None
+        tag = Tag.objects.filter(key=normalize_tag(tag_slug)).first() if tag_slug else None
+        return render(request, self.template_name, {'user_readings': user_readings,
+                                                    'monthly_readings': monthly_readings,
+                                                    'next_query': next_query,
+                                                    'is_first_page': cursor is None,
+                                                    'author_filter': author,
+                                                    'tag_filter': tag})
 
     @method_decorator(login_required)
     def dispatch(self, request, *args, **kwargs):
@@ -393,6 +498,7 @@ class ClearReadingHistory(View):
         current_user = request.user
         user_readings = UserReading.objects.filter(user=current_user).all()
         user_readings.delete()
+        UserMonthlyReadings.objects.filter(user=current_user).delete()
         messages.success(request, self.success_message)
         return redirect(self.redirect_to)
 
@@ -434,7 +540,8 @@ class ReactedArticlesBaseClass(ListView):
     def get_queryset(self):
         current_user = self.request.user
         return Reaction.objects.\
-            select_related('article').\
+            select_related('article__author').\
+            only('reaction_date', 'value', *card_fields('article')).\
             order_by('-reaction_date').\
             filter(
                 Q(user=current_user) &
@@ -538,9 +645,7 @@ class FavoriteArticlesList(ListView):
         if not favorite_object:
             return None
         else:
-            return favorite_object.articles.\
-                select_related('author').\
-                prefetch_related('tags').\
+            return favorite_object.articles.cards().\
                 order_by('id').all()
 
     @method_decorator(login_required)
@@ -552,7 +657,7 @@ class DeleteFavoriteArticle(View):
     redirect_to = 'personal:favorite-articles'
 
     def get_article(self, pk):
-        return Article.objects.filter(pk=pk).first()
+        return repository.get_article(pk)
 
     def get_favorite(self, user):
         return FavoriteArticles.objects.\
@@ -602,3 +707,38 @@ class ClearFavoritesView(View):
     @method_decorator(login_required)
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
+
+
+class ExportDataView(View):
+    """
+    Streams everything the user has on the site: 'format' is csv or ndjson,
+    'dataset' one of export.DATASETS or 'all' (NDJSON only),
+    'gzip' compresses the file when set to 1
+    """
+
+    def get(self, request, *args, **kwargs):
+        current_user = request.user
+        export_format = request.GET.get('format', 'ndjson')
+        dataset = request.GET.get('dataset', 'all')
+        gzip = request.GET.get('gzip') == '1'
+        if export_format not in export.FORMATS:
+            return HttpResponseBadRequest('Unknown export format')
+        if dataset == 'all':
+            datasets = list(export.DATASETS)
+        elif dataset in export.DATASETS:
+            datasets = [dataset]
+        else:
+            return HttpResponseBadRequest('Unknown dataset')
+        if export_format == 'csv' and len(datasets) != 1:
+            return HttpResponseBadRequest('CSV export needs a single dataset')
+        content_type = 'application/gzip' if gzip else export.FORMATS[export_format][0]
+        response = StreamingHttpResponse(
+            export.export(current_user, export_format, datasets, gzip=gzip),
+            content_type=content_type)
+        filename = export.export_filename(current_user, export_format, datasets, gzip=gzip)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
@@ -9,24 +9,42 @@ urlpatterns = [
          views.AuthorPageView.as_view(), name='author-page'),
     path('public/articles/<int:pk>/',
          views.ArticleDetailView.as_view(), name='article-detail'),
+    path('public/articles/<int:pk>/read/',
+         views.ReadArticleView.as_view(), name='read-article'),
+    path('public/articles/<int:pk>/read/json/',
+         views.ReadArticleView.as_view(as_json=True), name='read-article-json'),
     path('public/articles/<int:pk>/like/',
          views.LeaveLikeView.as_view(), name='like-article'),
+    path('public/articles/<int:pk>/like/json/',
+         views.LeaveLikeView.as_view(as_json=True), name='like-article-json'),
     path('public/articles/<int:pk>/dislike/',
          views.LeaveDislikeView.as_view(), name='dislike-article'),
+    path('public/articles/<int:pk>/dislike/json/',
+         views.LeaveDislikeView.as_view(as_json=True), name='dislike-article-json'),
     path('public/articles/<int:pk>/comment/',
          views.CommentArticleView.as_view(), name='comment-article'),
     path('public/comments/<int:pk>/delete/',
          views.DeleteCommentView.as_view(), name='delete-comment'),
     path('public/articles/<int:pk>/favorites/manage/',
          views.AddRemoveFavoriteArticle.as_view(), name='manage-favorites'),
+    path('public/articles/<int:pk>/favorites/manage/json/',
+         views.AddRemoveFavoriteArticle.as_view(as_json=True), name='manage-favorites-json'),
     path('public/articles/<int:pk>/author/subscribe/',
          views.SubscribeUnsubscribeThroughArticleDetail.as_view(), name='subscription-through-detail'),
+    path('public/articles/<int:pk>/author/subscribe/json/',
+         views.SubscribeUnsubscribeThroughArticleDetail.as_view(as_json=True),
+         name='subscription-through-detail-json'),
     path('public/authors/<int:pk>/subscribe/', views.SubscribeUnsubscribeThroughAuthorPageView.as_view(),
          name='subscription-through-author'),
+    path('public/authors/<int:pk>/subscribe/json/',
+         views.SubscribeUnsubscribeThroughAuthorPageView.as_view(as_json=True),
+         name='subscription-through-author-json'),
     path('public/articles/tags/<str:slug>/',
          views.ArticlesByTag.as_view(), name='articles-tag'),
     path('public/articles/search/',
          views.SearchArticlesView.as_view(), name='search'),
+    path('public/articles/search/suggestions/',
+         views.SearchSuggestionsView.as_view(), name='search-suggestions'),
     path('public/articles/authors/<int:pk>/', views.ArticlesByAuthor.as_view(),
          name='articles-by-author'),
     path('public/articles/<int:pk>/comments/',
@@ -1,61 +1,51 @@
 from typing import Any, Dict
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
 from django.core.exceptions import PermissionDenied
 from django.db.models.query_utils import Q
-from django.db.models import Sum
-from django.http import HttpResponseRedirect, Http404, HttpResponseNotAllowed, HttpResponseForbidden
+from django.db.models import Count, F
+from django.http import HttpResponseRedirect, Http404, HttpResponseNotAllowed, HttpResponseForbidden, JsonResponse
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView
 from django.views import View
-from taggit.models import Tag
 from users.models import CustomUser
-from core.models import Subscription, SocialMedia, UserDescription, Article, FavoriteArticles, Reaction, Comment, UserReading
+from core.models import Subscription, Article, FavoriteArticles, Reaction, Comment, UserReading, \
+    Tag
+from core import repository, search, typeahead
+from core.authors import get_author_card
+from core.versions import bump, instance
+from core.postings import parse_tag_query
+from core.tags import normalize_tag
 from public.forms import CommentArticleForm
 
 
 class AboutPageView(View):
     template_name = 'public/about_page.html'
 
-    def get_author(self, pk):
-        return CustomUser.objects.filter(pk=pk).first()
-
-    def get_description(self, user):
-        return UserDescription.objects.\
-            filter(user=user).first()
-
-    def get_social_media(self, user):
-        return SocialMedia.objects.\
-            filter(user=user).all().\
-            order_by('title')
-
-    def get_readings(self, author):
-        return Article.objects.filter(
-            author=author).all().aggregate(Sum('times_read'))
+    def get_card(self, pk):
+        return get_author_card(pk)
 
     def get(self, request, *args, **kwargs):
-        author = self.get_author(self.kwargs['pk'])
-        if not author:
+        card = self.get_card(self.kwargs['pk'])
+        if not card:
             raise Http404
-        description = self.get_description(author)
-        social_media_list = self.get_social_media(author)
-        readings = self.get_readings(author)['times_read__sum']
-        return render(request, self.template_name, {'description': description,
-                                                    'social_media_list': social_media_list,
-                                                    'author': author,
-                                                    'readings': readings})
+        return render(request, self.template_name, {'description': card.description,
+                                                    'social_media_list': card.social_media,
+                                                    'author': card.author,
+                                                    'readings': card.readings})
 
 
 class ArticleDetailView(View):
     template_name = 'public/article_detail.html'
 
-    def get_article(self, pk):
-        return Article.objects.\
-            select_related('author').\
-            filter(pk=pk).first()
+    def get_article(self, pk, with_content_html=False):
+        # without the content, its HTML is read only when the page shows it
+        return repository.get_article(pk, with_content_html)
 
     def get_favorite(self, user):
         return FavoriteArticles.objects.\
@@ -67,33 +57,6 @@ class ArticleDetailView(View):
             Q(subscribe_to=author)
         ).first()
 
-    def manage_user_readings(self, article, user):
-        user_readings = UserReading.objects.\
-            filter(
-                Q(article=article) &
-                Q(user=user)
-            ).all()
-        exists_for_current_date = False
-        user_reading_index = None
-
-        for index, user_reading in enumerate(user_readings):
-            if user_reading.date_read.date() == timezone.now().date():
-                exists_for_current_date = True
-                user_reading_index = index
-        if exists_for_current_date:
-            user_reading: UserReading = user_readings[user_reading_index]
-            user_reading.date_read = timezone.now()
-            user_reading.save()
-            return None
-        else:
-            user_reading = UserReading(
-                user=user,
-                article=article,
-                date_read=timezone.now()
-            )
-            user_reading.save()
-            return None
-
     def get_reaction(self, user, article):
         return Reaction.objects.\
             filter(
@@ -145,8 +108,7 @@ class ArticleDetailView(View):
         return dislikes
 
     def get_subscribers(self, author):
-        return Subscription.objects.\
-            filter(subscribe_to=author).count()
+        return get_author_card(author.pk).subscribers
 
     def get(self, request, *args, **kwargs):
         current_user = request.user
@@ -171,12 +133,11 @@ class ArticleDetailView(View):
 
     def post(self, request, *args, **kwargs):
         current_user = request.user
-        article = self.get_article(self.kwargs['pk'])
+        article = self.get_article(self.kwargs['pk'], with_content_html=True)
         if not article:
             raise Http404
         if current_user.is_authenticated:
-            article.times_read += 1
-            article.save()
+            article.times_read = ReadArticleView.record_read(article, current_user)
         favorite_status = self.set_favorite_status(current_user, article)
         reaction_status = self.set_reaction_status(current_user, article)
         likes = self.get_likes(article)
@@ -184,8 +145,6 @@ class ArticleDetailView(View):
         subscribers = self.get_subscribers(article.author)
         subscription_status = self.set_subscription_status(
             current_user, article.author)
-        if current_user.is_authenticated:
-            self.manage_user_readings(article, current_user)
         return render(request, self.template_name, {'article': article,
                                                     'favorite_status': favorite_status,
                                                     'show_content': True,
@@ -196,28 +155,116 @@ class ArticleDetailView(View):
                                                     'subscribers': subscribers})
 
 
+class ReadArticleView(View):
+    """
+    Shows the content of an article to its reader, counting the read.
+    Answers with the content alone, as a fragment of the article's page
+    to be revealed in place, or as JSON when routed with as_json=True.
+    """
+    template_name = 'public/includes/article_content.html'
+    as_json = False
+
+    def get_article(self, pk):
+        return repository.get_article(pk, with_content_html=True)
+
+    @classmethod
+    def record_read(cls, article, user):
+        """
+        Counts a read of the article by user and moves their reading of
+        it today, if any, to now. Returns the new number of reads.
+        """
+        now = timezone.now()
+        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        Article.objects.filter(pk=article.pk).\
+            update(times_read=F('times_read') + 1)
+        # update() doesn't send post_save. Only the article is bumped: read
+        # counts shown elsewhere, in lists and author cards, may lag behind
+        bump(instance(article))
+        updated = UserReading.objects.\
+            filter(user=user, article=article, date_read__gte=start_of_day).\
+            update(date_read=now)
+        if not updated:
+            UserReading.objects.create(user=user, article=article, date_read=now)
+        return article.times_read + 1
+
+    def post(self, request, *args, **kwargs):
+        current_user = request.user
+        article = self.get_article(self.kwargs['pk'])
+        if not article:
+            raise Http404
+        times_read = article.times_read
+        if current_user.is_authenticated:
+            times_read = self.record_read(article, current_user)
+        if self.as_json:
+            return JsonResponse({'content_html': repository.get_content_html(article),
+                                 'times_read': times_read})
+        return render(request, self.template_name, {'article': article,
+                                                    'times_read': times_read})
+
+
 class CommentsByArticleList(ListView):
     template_name = 'public/comments_by_article.html'
     context_object_name = 'comments'
+    # Pages hold this many threads, with all replies to them
+    paginate_by = 20
+
+    def get_article(self, pk):
+        return repository.get_article(pk)
 
     def get_queryset(self):
-        article_id = self.kwargs['pk']
-        article = Article.objects.filter(id=article_id).first()
-        if not article:
+        self.article = self.get_article(self.kwargs['pk'])
+        if not self.article:
             raise Http404
-        comments = Comment.objects.\
-            select_related('user').filter(article=article).\
-            order_by('pub_date').all()
-        return comments
+        return Comment.objects.\
+            filter(article=self.article, parent__isnull=True).\
+            order_by('path')
+
+    def get_threads(self, roots):
+        if not roots:
+            return []
+        return list(Comment.objects.select_related('user').threads(roots))
 
     def get_context_data(self, **kwargs: Any):
         context = super().get_context_data(**kwargs)
-        article = Article.objects.filter(id=self.kwargs['pk']).first()
-        context['article'] = article
+        context['article'] = self.article
+        context['comments'] = self.get_threads(list(context['page_obj'].object_list))
         return context
 
+    @classmethod
+    def get_comment_url(cls, comment):
+        """
+        URL of the page of comments showing the given one
+        """
+        roots_before = Comment.objects.\
+            filter(article_id=comment.article_id, parent__isnull=True, path__lt=comment.root_path).\
+            count()
+        url = reverse('public:article-comments', args=(comment.article_id, ))
+        return f'{url}?page={roots_before // cls.paginate_by + 1}#comment-{comment.id}'
+
+
+class ToggleResponseMixin:
+    """
+    Toggle views answer with a redirect back to the page, or, routed
+    with as_json=True (for the scripts of the pages), with the new state
+    as JSON instead, so the page doesn't have to be loaded again
+    """
+    as_json = False
 
-class AddRemoveFavoriteArticle(View):
+    def toggled(self, request, url, state, message=None):
+        if self.as_json:
+            return JsonResponse(state)
+        if message:
+            messages.success(request, message)
+        return HttpResponseRedirect(url)
+
+    def refused(self, request, url, message, status=403):
+        if self.as_json:
+            return JsonResponse({'message': message}, status=status)
+        messages.info(request, message)
+        return HttpResponseRedirect(url)
+
+
+class AddRemoveFavoriteArticle(ToggleResponseMixin, View):
     redirect_to = 'public:article-detail'
     success_remove = 'You successfully removed this article from your Favorites'
     success_add = 'You successfully added this article to your Favorites'
@@ -228,49 +275,49 @@ class AddRemoveFavoriteArticle(View):
             filter(user=user).first()
 
     def get_article(self, pk):
-        return Article.objects.filter(pk=pk).first()
+        return repository.get_article(pk)
 
-    def post(self, request, *args, **kwargs):
-        current_user = request.user
-        article = self.get_article(self.kwargs['pk'])
-        if not article:
-            raise Http404
-        if not current_user.is_authenticated:
-            messages.info(request, self.info_message)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
-        favorite = self.get_favorite(current_user)
+    def toggle_favorite(self, user, article):
+        favorite = self.get_favorite(user)
         if not favorite:
             # If user have never added any articles to favorites
             # then when they hit this view we both create new instance of
             # FavoriteArticles and add new article in many-to-many relationship
             # between FavoriteArticles and Article models
-            favorite = FavoriteArticles(user=current_user)
+            favorite = FavoriteArticles(user=user)
             favorite.save()
             favorite.articles.add(article)
-            messages.success(request, self.success_add)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+            return True
         # If user already has FavoriteArticles instance
         # we check if article in many-to-many relationship
-        if article not in favorite.articles.all():
-            # If not we add and return appropriate message about it
+        if not favorite.articles.filter(pk=article.pk).exists():
             favorite.articles.add(article)
-            messages.success(request, self.success_add)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
-        else:
-            # If it article is there, we remove it and return appropriate message about it
-            favorite.articles.remove(article)
-            messages.success(request, self.success_remove)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+            return True
+        favorite.articles.remove(article)
+        return False
+
+    def post(self, request, *args, **kwargs):
+        current_user = request.user
+        article = self.get_article(self.kwargs['pk'])
+        if not article:
+            raise Http404
+        url = reverse(self.redirect_to, args=(article.id, ))
+        if not current_user.is_authenticated:
+            return self.refused(request, url, self.info_message)
+        added = self.toggle_favorite(current_user, article)
+        state = {'favorite': added,
+                 'favorite_status': 'Remove from Favorites' if added else 'Add to Favorites'}
+        return self.toggled(request, url, state, self.success_add if added else self.success_remove)
 
 
-class LeaveReactionBaseClass(View):
+class LeaveReactionBaseClass(ToggleResponseMixin, View):
     is_dislike = False
     is_like = False
     info_message = ''
     redirect_to = 'public:article-detail'
 
     def get_article(self, pk):
-        return Article.objects.filter(pk=pk).first()
+        return repository.get_article(pk)
 
     def get_reaction(self, user, article):
         return Reaction.objects.\
@@ -305,20 +352,32 @@ class LeaveReactionBaseClass(View):
                                 value=1)
             reaction.save()
 
+    def get_state(self, user, article):
+        reaction = self.get_reaction(user, article)
+        counts = Reaction.objects.filter(article=article).aggregate(
+            likes=Count('id', filter=Q(value=1)),
+            dislikes=Count('id', filter=Q(value=-1)))
+        statuses = {1: 'You liked this article', -1: 'You disliked this article'}
+        return {'reaction': reaction.value if reaction else 0,
+                'reaction_status': statuses.get(reaction.value) if reaction else None,
+                **counts}
+
     def post(self, request, *args, **kwargs):
         current_user = request.user
         article = self.get_article(self.kwargs['pk'])
         if not article:
             raise Http404
+        url = reverse(self.redirect_to, args=(article.id, ))
         if not current_user.is_authenticated:
-            messages.info(request, self.info_message)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+            return self.refused(request, url, self.info_message)
         reaction = self.get_reaction(current_user, article)
         if self.is_dislike:
             self.leave_dislike(current_user, article, reaction)
         if self.is_like:
             self.leave_like(current_user, article, reaction)
-        return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+        if not self.as_json:
+            return HttpResponseRedirect(url)
+        return self.toggled(request, url, self.get_state(current_user, article))
 
 
 class LeaveLikeView(LeaveReactionBaseClass):
@@ -339,7 +398,17 @@ class CommentArticleView(View):
     template_name = 'public/comment_article.html'
 
     def get_article(self, pk):
-        return Article.objects.filter(pk=pk).first()
+        return repository.get_article(pk)
+
+    def get_parent(self, article, pk):
+        # Comment being replied to, if any
+        if not pk:
+            return None
+        parent = Comment.objects.select_related('user').\
+            filter(article=article, pk=pk).first() if pk.isdigit() else None
+        if not parent or not parent.can_be_replied:
+            raise Http404
+        return parent
 
     def get(self, request, *args, **kwargs):
         current_user = request.user
@@ -349,8 +418,11 @@ class CommentArticleView(View):
         if not current_user.is_authenticated:
             messages.info(request, self.info_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+        parent = self.get_parent(article, request.GET.get('parent'))
         form = self.form_class()
-        return render(request, self.template_name, {'form': form, 'article': article})
+        return render(request, self.template_name, {'form': form,
+                                                    'article': article,
+                                                    'parent': parent})
 
     def post(self, request, *args, **kwargs):
         current_user = request.user
@@ -360,14 +432,19 @@ class CommentArticleView(View):
         if not current_user.is_authenticated:
             messages.info(request, self.info_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
+        parent = self.get_parent(article, request.POST.get('parent'))
         form = self.form_class(request.POST)
         if form.is_valid():
             form.instance.article = article
             form.instance.user = current_user
-            form.save()
+            form.instance.parent = parent
+            # the comment count of the article is kept by core.signals
+            comment = form.save()
             messages.success(request, self.success_message)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id, )))
-        return render(request, self.template_name, {'form': form, 'article': article})
+            return HttpResponseRedirect(CommentsByArticleList.get_comment_url(comment))
+        return render(request, self.template_name, {'form': form,
+                                                    'article': article,
+                                                    'parent': parent})
 
 
 class DeleteCommentView(View):
@@ -383,10 +460,11 @@ class DeleteCommentView(View):
         comment = self.get_comment(self.kwargs['pk'])
         if not comment:
             raise Http404
-        if comment.user != current_user:
+        if comment.user_id != current_user.id:
             raise PermissionDenied
-        article_id = comment.article.id
-        comment.delete()
+        article_id = comment.article_id
+        # Replies to the comment go with it
+        Comment.objects.subtree(comment).delete()
         messages.success(request, self.success_message)
         return HttpResponseRedirect(reverse(self.redirect_to, args=(article_id, )))
 
@@ -402,9 +480,11 @@ class UpdateCommentView(View):
     template_name = 'public/update_comment.html'
 
     def get_comment(self, pk):
-        return Comment.objects.\
-            select_related('article').\
+        comment = Comment.objects.\
             filter(pk=pk).first()
+        if comment:
+            comment.article = repository.get_article(comment.article_id)
+        return comment
 
     def get(self, request, *args, **kwargs):
         current_user = request.user
@@ -429,7 +509,7 @@ class UpdateCommentView(View):
         if form.is_valid():
             form.save()
             messages.success(request, self.success_message)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(comment.article.id, )))
+            return HttpResponseRedirect(CommentsByArticleList.get_comment_url(comment))
         return render(request, self.template_name, {'comment': comment,
                                                     'form': form,
                                                     'article': comment.article})
@@ -439,20 +519,12 @@ class UpdateCommentView(View):
         return super().dispatch(request, *args, **kwargs)
 
 
-class SubscribeUnsubscribeThroughArticleDetail(View):
-    """
-    This view is called in 'article_detail.html' template,
-    and it redirects back to 'public:article-detail' view
-    """
+class SubscribeUnsubscribeBaseClass(ToggleResponseMixin, View):
     info_message_to_anonymous_user = 'You cannot subscribe to this author while you are not authenticated'
     info_message_to_auth_user = 'You cannot subscribe to yourself'
-    redirect_to = 'public:article-detail'
     success_message_subscribed = 'You successfully subscribed to this author'
     success_message_unsubscribed = 'You successfully unsubscribed from this author'
-
-    def get_article(self, pk):
-        return Article.objects.\
-            filter(pk=pk).first()
+    redirect_to = ''
 
     def get_subscription(self, user, author):
         return Subscription.objects.filter(
@@ -460,72 +532,93 @@ class SubscribeUnsubscribeThroughArticleDetail(View):
             Q(subscribe_to=author)
         ).first()
 
-    def post(self, request, *args, **kwargs):
-        current_user = request.user
-        article = self.get_article(self.kwargs['pk'])
-        if not article:
-            raise Http404
-        if not current_user.is_authenticated:
-            messages.info(request, self.info_message_to_anonymous_user)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id,)))
-        author = article.author
-        if author == current_user:
-            messages.info(request, self.info_message_to_auth_user)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id,)))
-        subscription = self.get_subscription(current_user, author)
+    def get_author_and_url(self, pk):
+        """
+        The author to subscribe to and the URL of the page to go back to
+        """
+        raise NotImplementedError
+
+    def toggle_subscription(self, user, author):
+        subscription = self.get_subscription(user, author)
         if not subscription:
             subscription = Subscription(
-                subscriber=current_user,
+                subscriber=user,
                 subscribe_to=author
             )
             subscription.save()
-            success_message = self.success_message_subscribed
-        else:
-            subscription.delete()
-            success_message = self.success_message_unsubscribed
-        messages.success(request, success_message)
-        return HttpResponseRedirect(reverse(self.redirect_to, args=(article.id,)))
+            return True
+        subscription.delete()
+        return False
+
+    def post(self, request, *args, **kwargs):
+        current_user = request.user
+        author, url = self.get_author_and_url(self.kwargs['pk'])
+        if not current_user.is_authenticated:
+            return self.refused(request, url, self.info_message_to_anonymous_user)
+        if author == current_user:
+            return self.refused(request, url, self.info_message_to_auth_user)
+        subscribed = self.toggle_subscription(current_user, author)
+        state = {'subscribed': subscribed,
+                 'subscription_status': 'Unsubscribe' if subscribed else 'Subscribe'}
+        if self.as_json:
+            state['subscribers'] = Subscription.objects.filter(subscribe_to=author).count()
+        message = self.success_message_subscribed if subscribed else self.success_message_unsubscribed
+        return self.toggled(request, url, state, message)
+
+
+class SubscribeUnsubscribeThroughArticleDetail(SubscribeUnsubscribeBaseClass):
+    """
+    This view is called in 'article_detail.html' template,
+    and it redirects back to 'public:article-detail' view
+    """
+    redirect_to = 'public:article-detail'
+
+    def get_article(self, pk):
+        return repository.get_article(pk)
+
+    def get_author_and_url(self, pk):
+        article = self.get_article(pk)
+        if not article:
+            raise Http404
+        return article.author, reverse(self.redirect_to, args=(article.id, ))
 
 
 class ArticlesByTag(ListView):
     context_object_name = 'articles'
     template_name = 'public/articles_by_tag.html'
 
+    def get_tag(self, slug):
+        return Tag.objects.filter(key=normalize_tag(slug)).first()
+
     def get_queryset(self):
-        tag_slug = self.kwargs['slug']
-        tag_object = Tag.objects.filter(slug=tag_slug).first()
-        articles = Article.objects.\
-            select_related('author').\
-            prefetch_related('tags').\
-            filter(tags=tag_object).\
+        self.tag = self.get_tag(self.kwargs['slug'])
+        if not self.tag:
+            return Article.objects.none()
+        articles = Article.objects.cards().\
+            filter(tags=self.tag).\
             order_by('-times_read').all()
         return articles
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['tag'] = ' '.join(self.kwargs['slug'].split('-'))
+        if self.tag:
+            context['tag'] = self.tag.name
+        else:
+            context['tag'] = ' '.join(self.kwargs['slug'].split('-'))
         return context
 
 
 class SearchArticlesView(View):
     template_name = 'public/search_results.html'
+    # Results are paginated, by this many articles
+    paginate_by = 20
 
-    def get_articles(self, search_string):
-        return Article.objects.\
-            select_related('author').\
-            prefetch_related('tags').\
-            filter(
-                Q(title__icontains=search_string) |
-                Q(author__username__icontains=search_string)
-            ).order_by('-times_read').all()
-
-    def convert_tag_to_slug(self, tag: str):
-        # this method is needed if
-        # someone enters something like this: #pop music
-        if ' ' in tag:
-            return '-'.join(tag.split())
-        else:
-            return tag
+    def get_page(self, article_ids, page_number):
+        # Only the articles of the page are read, in the order of the results
+        page = Paginator(article_ids, self.paginate_by).get_page(page_number)
+        page_ids = list(page.object_list)
+        articles = Article.objects.cards().in_bulk(page_ids)
+        return page, [articles[pk] for pk in page_ids if pk in articles]
 
     def get(self, request, *args, **kwargs):
         query = self.request.GET.get('query')
@@ -538,25 +631,61 @@ class SearchArticlesView(View):
         if query.strip() == '%':
             return render(request, 'public/empty_search.html')
 
-        if query.strip()[0] == '#' or query.strip()[0] == '%':
-            tag_slug = self.convert_tag_to_slug(query.strip()[1:])
-            return HttpResponseRedirect(reverse('public:articles-tag', args=(tag_slug, )))
-
-        articles = self.get_articles(query)
+        tag_query = parse_tag_query(query)
+        if tag_query and tag_query.is_single_tag:
+            return HttpResponseRedirect(reverse('public:articles-tag', args=(tag_query.groups[0][0], )))
+        match, article_ids = search.find_articles(query, tag_query)
+        if match == 'tags' and not tag_query:
+            # tags without a letter or a digit
+            return render(request, 'public/empty_search.html')
+        page, articles = self.get_page(article_ids, request.GET.get('page'))
         return render(request, self.template_name, {'articles': articles,
-                                                    'query': query})
+                                                    'query': query,
+                                                    'page_obj': page,
+                                                    'tag_query': match == 'tags',
+                                                    'similar': match == 'similar'})
+
+
+class SearchSuggestionsView(View):
+    """
+    Suggestions of articles, authors and tags for what is typed in the
+    search box ('q' parameter), most popular first, as JSON
+    """
+    default_limit = 8
+    max_limit = typeahead.MAX_SUGGESTIONS
+    # Suggestions may be this many seconds old
+    max_age = 60
+
+    def get_limit(self, value):
+        if not value or not value.isdigit():
+            return self.default_limit
+        return max(1, min(int(value), self.max_limit))
+
+    def get_url(self, kind, pk, value):
+        if kind == 'article':
+            return reverse('public:article-detail', args=(pk, ))
+        if kind == 'author':
+            return reverse('public:author-page', args=(pk, ))
+        return reverse('public:articles-tag', args=(value, ))
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '')
+        limit = self.get_limit(request.GET.get('limit'))
+        suggestions = [
+            {'type': kind, 'label': f'#{label}' if kind == 'tag' else label,
+             'url': self.get_url(kind, pk, value)}
+            for kind, pk, label, value in typeahead.suggest(query, limit)
+        ]
+        response = JsonResponse({'query': query, 'suggestions': suggestions})
+        patch_cache_control(response, public=True, max_age=self.max_age)
+        return response
 
 
 class AuthorPageView(View):
     template_name = 'public/author_page.html'
 
-    def get_author(self, pk):
-        return CustomUser.objects.filter(pk=pk).first()
-
-    def get_subscribers(self, author):
-        return Subscription.objects.\
-            filter(subscribe_to=author).\
-            count()
+    def get_card(self, pk):
+        return get_author_card(pk)
 
     def get_subscription(self, user, author):
         return Subscription.objects.filter(
@@ -575,68 +704,38 @@ class AuthorPageView(View):
 
     def get(self, request, *args, **kwargs):
         current_user = request.user
-        author = self.get_author(self.kwargs['pk'])
-        if not author:
+        card = self.get_card(self.kwargs['pk'])
+        if not card:
             raise Http404
         subscription_status = self.set_subscription_status(
-            current_user, author)
-        subscribers = self.get_subscribers(author)
-        return render(request, self.template_name, {'author': author,
+            current_user, card.author)
+        return render(request, self.template_name, {'author': card.author,
                                                     'subscription_status': subscription_status,
-                                                    'subscribers': subscribers})
+                                                    'subscribers': card.subscribers})
 
 
-class SubscribeUnsubscribeThroughAuthorPageView(View):
-    info_message_to_anonymous_user = 'You cannot subscribe to this author while you are not authenticated'
-    info_message_to_auth_user = 'You cannot subscribe to yourself'
+class SubscribeUnsubscribeThroughAuthorPageView(SubscribeUnsubscribeBaseClass):
     redirect_to = 'public:author-page'
-    success_message_subscribed = 'You successfully subscribed to this author'
-    success_message_unsubscribed = 'You successfully unsubscribed from this author'
 
     def get_author(self, pk):
         return CustomUser.objects.filter(pk=pk).first()
 
-    def get_subscription(self, user, author):
-        return Subscription.objects.filter(
-            Q(subscriber=user) &
-            Q(subscribe_to=author)
-        ).first()
-
-    def post(self, request, *args, **kwargs):
-        current_user = request.user
-        author = self.get_author(self.kwargs['pk'])
+    def get_author_and_url(self, pk):
+        author = self.get_author(pk)
         if not author:
             raise Http404
-        if not current_user.is_authenticated:
-            messages.info(request, self.info_message_to_anonymous_user)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(author.id, )))
-        if current_user == author:
-            messages.info(request, self.info_message_to_auth_user)
-            return HttpResponseRedirect(reverse(self.redirect_to, args=(author.id, )))
-        subscription = self.get_subscription(current_user, author)
-        if not subscription:
-            subscription = Subscription(
-                subscriber=current_user,
-                subscribe_to=author
-            )
-            subscription.save()
-            success_message = self.success_message_subscribed
-        else:
-            subscription.delete()
-            success_message = self.success_message_unsubscribed
-        messages.success(request, success_message)
-        return HttpResponseRedirect(reverse(self.redirect_to, args=(author.id, )))
+        return author, reverse(self.redirect_to, args=(author.id, ))
 
 
 class ArticlesByAuthor(View):
     template_name = 'public/articles_by_author.html'
 
     def get_author(self, pk):
-        return CustomUser.objects.filter(pk=pk).first()
+        card = get_author_card(pk)
+        return card.author if card else None
 
     def get_articles(self, author):
-        return Article.objects.\
-            prefetch_related('tags').\
+        return Article.objects.cards().\
             filter(author=author).\
             order_by('-times_read').all()
 
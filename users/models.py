@@ -16,3 +16,10 @@ class CustomUser(AbstractUser):
         unique=True, help_text='Required. Enter a valid email address.')
     user_image = models.ImageField(null=True, blank=True,
                                    upload_to='users/images', validators=[validate_image])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # to tell renames from other saves, such as those of last_login
+        user._loaded_username = user.__dict__.get('username')
+        return user